@@ -1,90 +1,149 @@
 # create_csv_from_strings
-
-from ghidra.program.flatapi import FlatProgramAPI
-from ghidra.program.model.symbol import SymbolTable
+#
+# Extracts every pointer table listed in a manifest, plus the Shift JIS strings they point to,
+# into csvs in the same format convert_ghidra_csv.py writes (jp_pointer, jp_address, jp_string, jp_text)
+#
+# Run it headless so all of the tables come out of one session:
+#   analyzeHeadless <project dir> psx_spectral_tower -process SLPS_004.76 -noanalysis -readOnly \
+#       -scriptPath <repo>/ghidra -postScript create_csv_from_strings.py <manifest> <output dir>
+#
+# The manifest is tab separated with a header line: name, start, end
+# start and end can be labels or hex addresses; end is the first word after the table
+# Each table is written to <output dir>/<name>_strings.csv
+
+from java.lang import String
+import binascii
+import jarray
+import struct
 import csv
 import os
 
 
-def read_shift_jis_string(api, address):
+# same range the old script used to decide if a word is a pointer
+pointer_min = 0x80000000
+pointer_max = 0x80200000
+
+# pointer targets further apart than this get read into separate buffers
+cluster_gap = 0x10000
+
+# how far past the last target to read, to make sure its terminator is in the buffer
+string_margin = 0x400
+
+
+def read_buffer(address, length):
+    '''
+    read a whole region in one call and turn it into a python byte string
+    '''
+    java_bytes = jarray.zeros(length, "b")
+    currentProgram.getMemory().getBytes(address, java_bytes)
+    return String(java_bytes, "ISO-8859-1").encode("latin-1")
+
+
+def to_address(value):
+    return currentProgram.getAddressFactory().getDefaultAddressSpace().getAddress(value)
+
+
+def get_address(name):
     '''
-    Reads a null-terminated Shift JIS string starting at the given address.
+    a label or a hex address
     '''
-    string_bytes = []
-    while True:
-        byte = api.getByte(address)
-        if byte == 0:  # Null terminator
-            break
-        string_bytes.append(str(hex(byte & 0xFF))[2:])  # Ensure unsigned byte and remove "0x" prefix
-        address = address.add(1)
+    try:
+        return to_address(int(name, 16))
+    except ValueError:
+        symbols = currentProgram.getSymbolTable().getGlobalSymbols(name)
+        if not symbols:
+            raise Exception("Label '{}' not found!".format(name))
+        return symbols[0].getAddress()
+
 
-    # Decode bytes as Shift JIS
-    hex_string = str.join("", string_bytes)
-    return hex_string.decode("shift_jis", errors="replace")
+def read_manifest(manifest_path):
+    with open(manifest_path) as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        return [(row["name"], row["start"], row["end"]) for row in reader]
 
 
-def get_address_by_label(label_name):
+def get_clusters(targets):
     '''
-    Finds the address of a label by name.
+    group sorted pointer targets that are close enough together to read as one buffer
     '''
-    symbols = currentProgram.symbolTable.getGlobalSymbols(label_name)
-    symbol = symbols[0]
-    if symbol is None:
-        raise Exception("Label '{}' not found!".format(label_name))
-    return symbol.getAddress()
+    clusters = []
+    for target in sorted(set(targets)):
+        if clusters and target - clusters[-1][-1] <= cluster_gap:
+            clusters[-1].append(target)
+        else:
+            clusters.append([target])
+    return clusters
 
 
-def extract_pointer_table(start_label, end_label):
+def read_strings(targets):
     '''
-    Extracts pointer table data using start and end labels.
+    read every target string out of a few big buffers
+    returns target -> raw bytes (without the terminator)
     '''
-    api = FlatProgramAPI(currentProgram)
+    strings = {}
+    for cluster in get_clusters(targets):
+        start = cluster[0]
+        end = cluster[-1] + string_margin
 
-    # Get start and end addresses based on labels
-    pointer_table_start = get_address_by_label(start_label)
-    pointer_table_end = get_address_by_label(end_label)
+        # don't run off the end of the memory block
+        block = currentProgram.getMemory().getBlock(to_address(cluster[-1]))
+        end = min(end, block.getEnd().getOffset() + 1)
+        buffer = read_buffer(to_address(start), end - start)
 
-    # Generate CSV file name based on start label
-    csv_file = "{}_strings.csv".format(start_label)
-    csv_file = csv_file = os.path.expanduser("~/ghidra_scripts/" + csv_file)
+        for target in cluster:
+            offset = target - start
+            terminator = buffer.find("\x00", offset)
+            if terminator == -1:
+                terminator = len(buffer)
+            strings[target] = buffer[offset:terminator]
 
-    # Open CSV file for writing
-    with open(csv_file, "w") as f:
-        writer = csv.writer(f, delimiter="\t")
-        writer.writerow(["jp_pointer", "jp_address", "jp_string"])
+    return strings
 
-        current_pointer_address = pointer_table_start
 
-        # get pointer and data words
-        while not current_pointer_address.equals(pointer_table_end):
-            current_word_value = api.getLong(current_pointer_address)
-            current_word_value = current_word_value & 0xffffffff # convert to unsigned
+def extract_pointer_table(name, start, end, output_path):
+    '''
+    write one pointer table and its strings to a csv
+    '''
+    table_start = get_address(start)
+    table_end = get_address(end)
+    n_words = int(table_end.subtract(table_start)) // 4
 
-            # check if word is a pointer
-            if 0x80000000 <= current_word_value <= 0x80200000:
-                target_address_value = str(hex(current_word_value))[:-1] # remove "L" at the end of the string
-                target_address = currentProgram.getAddressFactory().getAddress(target_address_value)
+    table = read_buffer(table_start, 4 * n_words)
+    words = struct.unpack("<{}I".format(n_words), table)
 
-                # Read the string at the target address
-                string = read_shift_jis_string(api, target_address)
+    targets = [word for word in words if pointer_min <= word <= pointer_max]
+    strings = read_strings(targets)
 
-                # Write the data to the CSV
-                writer.writerow([current_pointer_address.toString(), target_address.toString(), string])
+    csv_file = os.path.join(output_path, "{}_strings.csv".format(name))
+    with open(csv_file, "wb") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(["jp_pointer", "jp_address", "jp_string", "jp_text"])
+
+        for i, word in enumerate(words):
+            pointer_address = "{:08x}".format(table_start.getOffset() + 4 * i)
+
+            # check if word is a pointer
+            if pointer_min <= word <= pointer_max:
+                raw_bytes = strings[word]
+                text = raw_bytes.decode("shift_jis", "replace").encode("utf-8")
+                writer.writerow([pointer_address, "{:08x}".format(word), binascii.hexlify(raw_bytes), text])
 
             # if it isn't, just write the word
             else:
-                writer.writerow([current_pointer_address, current_word_value, ""])
+                writer.writerow([pointer_address, word, "", ""])
 
+    print("Pointer table and Shift JIS strings extracted to: {}".format(csv_file))
 
-            # Go to next pointer
-            current_pointer_address = current_pointer_address.next().next().next().next()
 
-    print("Pointer table and Shift JIS strings extracted to: {}".format(csv_file))
+def extract_all(manifest_path, output_path):
+    for name, start, end in read_manifest(manifest_path):
+        extract_pointer_table(name, start, end, output_path)
 
 
-# Parameters
-start_label = "start_label"  # Replace with the name of the start label
-end_label = "end_label"      # Replace with the name of the end label
+# Parameters, from the headless command line
+args = getScriptArgs()
+manifest_path = args[0] if len(args) > 0 else os.path.join(os.path.dirname(getSourceFile().getAbsolutePath()), "pointer_tables.tsv")
+output_path = args[1] if len(args) > 1 else os.getcwd()
 
 # Run the extraction
-extract_pointer_table(start_label, end_label)
+extract_all(manifest_path, output_path)
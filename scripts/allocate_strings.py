@@ -0,0 +1,238 @@
+import numpy as np
+import bisect
+
+# strings have to start on a word boundary
+alignment = 4
+
+# give up proving the exact solution is optimal after this many search steps
+exact_node_limit = 1000000
+
+
+def align(address):
+    return (address + alignment - 1) // alignment * alignment
+
+
+def get_bins(block_dictionary):
+    '''
+    (block, start address, capacity) for every real block
+    the last block in the dictionary is the fake overflow block, so leave it out
+    '''
+    blocks = list(block_dictionary.items())[:-1]
+    bins = []
+    for block, (start_address, end_address) in blocks:
+        start_address = align(start_address)
+        bins.append((block, start_address, max(end_address - start_address, 0)))
+    return bins
+
+
+def allocate_greedy(sizes, capacities):
+    '''
+    the old way: go through the strings in order and move on to the next block as soon as one doesn't fit
+    (it never goes back, and it won't fill a block to the very last byte)
+    '''
+    result = [None] * len(sizes)
+    bin_index = 0
+    used = 0
+    for i, size in enumerate(sizes):
+        if bin_index < len(capacities) and used + size >= capacities[bin_index]:
+            bin_index += 1
+            used = 0
+        if bin_index >= len(capacities):
+            break
+        result[i] = bin_index
+        used += size
+    return result
+
+
+def allocate_best_fit_decreasing(sizes, capacities):
+    '''
+    place the biggest strings first, each in the block it leaves the least room in
+    '''
+    result = [None] * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+
+    # (room left, block) kept sorted, so the tightest block that fits is one bisect away
+    # (ties go to the lowest block, same as checking them in order)
+    rooms = sorted((room, j) for j, room in enumerate(capacities))
+
+    for i in order:
+        k = bisect.bisect_left(rooms, (sizes[i], -1))
+        if k < len(rooms):
+            room, best_bin = rooms.pop(k)
+            result[i] = best_bin
+            bisect.insort(rooms, (room - sizes[i], best_bin))
+
+    return result
+
+
+def allocate_exact(sizes, capacities):
+    '''
+    branch and bound search for the packing that places the most bytes
+    starts from the best fit decreasing answer, so it's never worse than that
+    only really meant for a handful of blocks and strings; on big tables it stops
+    after exact_node_limit steps and returns the best packing found so far
+    '''
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+    sorted_sizes = [sizes[i] for i in order]
+    remaining_totals = np.cumsum(sorted_sizes[::-1])[::-1].tolist() + [0]
+
+    start = allocate_best_fit_decreasing(sizes, capacities)
+    best = {
+        "placed": sum(size for size, bin_index in zip(sizes, start) if bin_index is not None),
+        "assignment": [start[i] for i in order],
+    }
+    goal = min(sum(sizes), sum(capacities))
+    assignment = [None] * len(sorted_sizes)
+    remaining = list(capacities)
+    n_nodes = 0
+
+    def visit(k, placed):
+        '''
+        count a node, and say whether it's worth going below it
+        '''
+        nonlocal n_nodes
+        n_nodes += 1
+        if placed + remaining_totals[k] <= best["placed"]:
+            return False
+        if k == len(sorted_sizes):
+            best["placed"] = placed
+            best["assignment"] = list(assignment)
+            return False
+        return True
+
+    def get_choices(k):
+        '''
+        blocks to try string k in, then None for leaving it out
+        blocks with the same room left are interchangeable, so only try one of them
+        '''
+        tried = set()
+        choices = []
+        for j, room in enumerate(remaining):
+            if sorted_sizes[k] <= room and room not in tried:
+                tried.add(room)
+                choices.append(j)
+        choices.append(None)
+        return iter(choices)
+
+    # depth first, with an explicit stack (one frame per string) so big tables can't hit the recursion limit
+    # a frame is [string, bytes placed before it, choices left, the block it's in right now]
+    stack = [[0, 0, get_choices(0), None]] if visit(0, 0) else []
+    while stack and best["placed"] < goal and n_nodes <= exact_node_limit:
+        frame = stack[-1]
+        k, placed, choices, current = frame
+
+        # take back the last choice before trying the next one
+        if current is not None:
+            remaining[current] += sorted_sizes[k]
+            assignment[k] = None
+            frame[3] = None
+
+        j = next(choices, "done")
+        if j == "done":
+            stack.pop()
+            continue
+
+        if j is not None:
+            remaining[j] -= sorted_sizes[k]
+            assignment[k] = j
+            frame[3] = j
+            placed += sorted_sizes[k]
+
+        if visit(k + 1, placed):
+            stack.append([k + 1, placed, get_choices(k + 1), None])
+
+    result = [None] * len(sizes)
+    for i, bin_index in zip(order, best["assignment"]):
+        result[i] = bin_index
+    return result
+
+
+allocators = {
+    "greedy": allocate_greedy,
+    "best_fit_decreasing": allocate_best_fit_decreasing,
+    "exact": allocate_exact,
+}
+
+
+def get_english_addresses(lengths, jp_addresses, block_dictionary, allocator="best_fit_decreasing"):
+    '''
+    pick a block for every english string, then lay each block out in address order
+    anything that doesn't fit goes in the overflow block, like before; its address there is only a placeholder
+    (relocate_overflow can move it into free space, and check_placed stops it from ever getting written)
+    repeated strings (length 0) point at the string they repeat
+    takes plain lists (rows in japanese address order) and returns the block and address of every row
+    '''
+    bins = get_bins(block_dictionary)
+    overflow_block = list(block_dictionary)[-1]
+    overflow_address = block_dictionary[overflow_block][0]
+
+    string_rows = [i for i, length in enumerate(lengths) if length != 0]
+    sizes = [align(lengths[i]) for i in string_rows]
+    bin_indices = allocators[allocator](sizes, [capacity for _, _, capacity in bins])
+
+    en_blocks = [overflow_block] * len(lengths)
+    en_addresses = [overflow_address] * len(lengths)
+    next_addresses = [start_address for _, start_address, _ in bins]
+    next_overflow_address = overflow_address
+
+    # rows are already in japanese address order, so just go down the list
+    for i, size, bin_index in zip(string_rows, sizes, bin_indices):
+        if bin_index is None:
+            en_addresses[i] = next_overflow_address
+            next_overflow_address += size
+        else:
+            en_blocks[i] = bins[bin_index][0]
+            en_addresses[i] = next_addresses[bin_index]
+            next_addresses[bin_index] += size
+
+    # point repeats at the first copy
+    first_rows = {}
+    for i in string_rows:
+        first_rows.setdefault(jp_addresses[i], i)
+    for i, length in enumerate(lengths):
+        if length == 0 and jp_addresses[i] in first_rows:
+            en_blocks[i] = en_blocks[first_rows[jp_addresses[i]]]
+            en_addresses[i] = en_addresses[first_rows[jp_addresses[i]]]
+
+    return en_blocks, en_addresses
+
+
+def check_placed(table_name, en_texts, en_blocks, en_lengths, block_dictionary):
+    '''
+    refuse to go on while any string is still in the overflow block,
+    otherwise its pointer would get written with an address near 0
+    '''
+    overflow_block = list(block_dictionary)[-1]
+    unplaced = [text for text, block, length in zip(en_texts, en_blocks, en_lengths) if block == overflow_block and length != 0]
+    if unplaced:
+        raise ValueError(table_name + ": " + str(len(unplaced)) + " strings don't fit in any block: "
+                         + ", ".join(repr(text) for text in unplaced))
+
+
+def get_block_report(table, block_dictionary):
+    '''
+    how full each block is, and which rows didn't fit anywhere
+    '''
+    overflow_block = list(block_dictionary)[-1]
+    en_blocks = table.integers["en_block"]
+    en_lengths = table.integers["en_length"]
+    stored = en_lengths != 0
+
+    block_rows = []
+    for block, start_address, capacity in get_bins(block_dictionary):
+        used = int(sum(align(length) for length in en_lengths[stored & (en_blocks == block)].tolist()))
+        block_rows.append((block, start_address, capacity, used, capacity - used))
+
+    overflow = np.flatnonzero(stored & (en_blocks == overflow_block))
+    return block_rows, overflow
+
+
+def print_block_report(table, block_dictionary):
+    block_rows, overflow = get_block_report(table, block_dictionary)
+
+    for block, start_address, capacity, used, slack in block_rows:
+        print("block", block, hex(start_address), "capacity:", capacity, "used:", used, "slack:", slack)
+
+    print(len(overflow), "strings did not fit,", int(table.integers["en_length"][overflow].sum()), "bytes")
+    for i in overflow:
+        print("   ", table.get_csv_value("jp_address", i), repr(table[i].en_text), table[i].en_length)
@@ -0,0 +1,53 @@
+import re
+
+
+def encode_ascii(ascii_string):
+    '''
+    encode an ascii string
+    if the string has an odd number of characters, add a trailing space
+    then add zero terminators until the number of bytes is a multiple of 4
+    '''
+    # if there is no string
+    if ascii_string == "":
+        return ""
+
+    # remove non-ascii characters before encoding
+    ascii_string = replace_non_ascii_characters(ascii_string)
+
+    # encode and do regex replacement
+    byte_string = encode_and_regex_replace(ascii_string)
+
+    # check number of characters
+    if len(byte_string) % 2 != 0:
+        byte_string += b"\x20"
+
+    # add zeros
+    byte_string += b"\x00"
+    while len(byte_string) % 4 != 0:
+        byte_string += b"\x00"
+
+    return byte_string
+
+
+def replace_non_ascii_characters(ascii_string):
+    '''
+    remove automatic non-ascii characters before encoding
+    '''
+    # replace "smart" apostrophe
+    ascii_string = ascii_string.replace("’", "'")
+
+    return ascii_string
+
+
+def encode_and_regex_replace(ascii_string):
+    '''
+    replace spaces before odd-indexed capitals
+    '''
+    byte_array = bytearray(ascii_string.encode("ascii"))
+
+    for match in re.finditer(r" ([A-Z])", ascii_string):
+        space_index = match.start()
+        ascii_code = byte_array[space_index + 1]
+        byte_array[space_index] = ascii_code - 0x40
+
+    return bytes(byte_array)
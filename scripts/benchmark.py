@@ -0,0 +1,242 @@
+from contextlib import redirect_stdout
+from pathlib import Path
+from datetime import date
+import numpy as np
+import subprocess
+import tempfile
+import platform
+import time
+import csv
+import sys
+import io
+
+from rom_image import RomImage
+from decode_char_tiles import tile_table_kanji, decode_tile_bytes
+from encode_char_tiles import char_width, tile_height, row_height, load_sheet, encode_sheet
+from create_ascii_binary import image_paths, n_row_bytes
+from string_table import (StringTable, prepare_for_writing, get_block_dictionary, get_table_name, get_output_file_name,
+                          get_pointer_table, get_block_data)
+from string_pool import translations_path
+from synthetic_rom import build_synthetic_rom, get_chunk_layout, get_n_glyphs_kanji, chunk_table_kanji
+
+# one line per benchmark per run, so runs from different commits can be compared
+results_path = Path(__file__).resolve().parent.parent / "benchmarks" / "results.csv"
+result_columns = ["commit", "date", "machine", "benchmark", "scale", "n_items", "seconds"]
+
+scales = [1, 10, 100]
+
+# take the best of this many runs, the others are mostly noise
+n_repeats = 3
+
+# copies of a table get moved this far apart, so their addresses never collide
+copy_stride = 0x100000
+
+# the command line entry point, for timing how long it takes to start
+cli_path = Path(__file__).resolve().parent / "spectral.py"
+
+# slower than the last run by more than this is worth a look
+regression_ratio = 1.2
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=results_path.parent.parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def time_best(function):
+    best = None
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def scale_translation_file(input_file, scale, output_file):
+    '''
+    make a table scale times as big by repeating it at shifted addresses
+    (words that aren't pointers keep their value)
+    '''
+    table = StringTable.read(input_file)
+    is_pointer = table.integers["is_pointer"] != 0
+
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(table.header)
+        for k in range(scale):
+            integers = dict(table.integers)
+            integers["jp_pointer"] = table.integers["jp_pointer"] + k * copy_stride
+            integers["jp_address"] = np.where(is_pointer, table.integers["jp_address"] + k * copy_stride, table.integers["jp_address"])
+            copy = StringTable(table.header, integers, table.arena, table.starts, table.lengths)
+            writer.writerows([copy.get_csv_value(name, i) for name in table.header] for i in range(len(copy)))
+
+
+def benchmark_decode(rom, scale, n_kanji):
+    '''
+    every kanji tile, scale times over
+    '''
+    tile_bytes = np.tile(np.frombuffer(rom.slice(tile_table_kanji, 26 * n_kanji), dtype=np.uint8), scale)
+    return n_kanji * scale, time_best(lambda: decode_tile_bytes(tile_bytes))
+
+
+def benchmark_encode(scale):
+    '''
+    both ascii sheets, stacked scale times
+    '''
+    inks = [np.tile(load_sheet(image_path), (scale, 1)) for image_path in image_paths]
+    n_tiles = sum(len(encode_sheet(ink, char_width, tile_height, row_height, n_row_bytes)) for ink in inks)
+    return n_tiles, time_best(lambda: [encode_sheet(ink, char_width, tile_height, row_height, n_row_bytes) for ink in inks])
+
+
+def benchmark_prepare(input_files):
+    with redirect_stdout(io.StringIO()):
+        tables = [prepare_for_writing(input_file) for input_file in input_files]
+        seconds = time_best(lambda: [prepare_for_writing(input_file) for input_file in input_files])
+    return tables, sum(len(table) for table in tables), seconds
+
+
+def benchmark_startup():
+    '''
+    cold start of the command line, in a fresh interpreter every time
+    '''
+    return 1, time_best(lambda: subprocess.run([sys.executable, str(cli_path), "--help"], capture_output=True, check=True))
+
+
+def write_binaries(tables, input_files, output_path):
+    '''
+    everything create_translation_binary writes, minus the overflow block
+    (that's always 100 MB of zeros, so it would just time the disk)
+    '''
+    n_bytes = 0
+    for table, input_file in zip(tables, input_files):
+        table_name = get_table_name(input_file)
+        try:
+            files = [get_pointer_table(table, table_name)]
+        except ValueError:
+            # a table with strings that fit in no block has no pointer table yet, its blocks still get timed
+            files = []
+        for block, (start_address, end_address) in list(get_block_dictionary(table).items())[:-1]:
+            files.append((get_output_file_name(table_name, start_address, end_address),
+                          get_block_data(table, block, start_address, end_address)))
+
+        for file_name, data in files:
+            (Path(output_path) / file_name).write_bytes(data)
+            n_bytes += len(data)
+    return n_bytes
+
+
+def print_result(benchmark, scale, n_items, seconds):
+    print(format(benchmark, "20"), format(scale, ">4") + "x", format(n_items, ">9"), "items",
+          format(1000 * seconds, ">10.2f"), "ms")
+
+
+def run_benchmarks(scales):
+    '''
+    build a synthetic rom and scaled copies of the translations, then time everything at every scale
+    '''
+    input_files = sorted(translations_path.glob("*.csv"))
+    results = []
+
+    n_runs, seconds = benchmark_startup()
+    results.append(("cli_startup", 1, n_runs, seconds))
+    print_result(*results[-1])
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        temp_path = Path(temp_path)
+        rom_file = temp_path / "SLPS_004.76"
+        with redirect_stdout(io.StringIO()):
+            rom_file.write_bytes(build_synthetic_rom(input_files))
+            n_kanji = get_chunk_layout(get_n_glyphs_kanji(input_files))[1][chunk_table_kanji]
+
+        with RomImage(rom_file) as rom:
+            for scale in scales:
+                scale_path = temp_path / ("x" + str(scale))
+                scale_path.mkdir()
+                scaled_files = [scale_path / input_file.name for input_file in input_files]
+                for input_file, scaled_file in zip(input_files, scaled_files):
+                    scale_translation_file(input_file, scale, scaled_file)
+
+                n_tiles, seconds = benchmark_decode(rom, scale, n_kanji)
+                results.append(("decode_tiles", scale, n_tiles, seconds))
+
+                n_tiles, seconds = benchmark_encode(scale)
+                results.append(("encode_tiles", scale, n_tiles, seconds))
+
+                tables, n_rows, seconds = benchmark_prepare(scaled_files)
+                results.append(("prepare_for_writing", scale, n_rows, seconds))
+
+                output_path = scale_path / "output"
+                output_path.mkdir()
+                n_bytes = write_binaries(tables, scaled_files, output_path)
+                seconds = time_best(lambda: write_binaries(tables, scaled_files, output_path))
+                results.append(("binary_output", scale, n_bytes, seconds))
+
+                for result in results[-4:]:
+                    print_result(*result)
+
+    return results
+
+
+def read_results():
+    if not results_path.exists():
+        return []
+    with open(results_path, newline="") as f:
+        return list(csv.DictReader(f, delimiter="\t"))
+
+
+def save_results(results, commit, machine):
+    '''
+    append this run to the results file
+    '''
+    new_file = not results_path.exists()
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_path, "a", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        if new_file:
+            writer.writerow(result_columns)
+        for benchmark, scale, n_items, seconds in results:
+            writer.writerow([commit, date.today().isoformat(), machine, benchmark, scale, n_items, format(seconds, ".6f")])
+
+
+def compare_results(results, old_results, commit, machine):
+    '''
+    compare against the last run from a different commit on the same machine
+    '''
+    previous = [row for row in old_results if row["machine"] == machine and row["commit"] != commit]
+    if not previous:
+        print("nothing to compare against yet")
+        return
+
+    last_commit = previous[-1]["commit"]
+    last = {(row["benchmark"], int(row["scale"])): float(row["seconds"]) for row in previous if row["commit"] == last_commit}
+
+    print("compared with", last_commit + ":")
+    for benchmark, scale, n_items, seconds in results:
+        if (benchmark, scale) not in last:
+            continue
+        ratio = seconds / last[(benchmark, scale)]
+        flag = "  <- slower" if ratio > regression_ratio else ""
+        print("   ", format(benchmark, "20"), format(scale, ">4") + "x", format(ratio, ">6.2f") + "x the time" + flag)
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python benchmark.py [scales...]
+    '''
+    if len(sys.argv) > 1:
+        scales = [int(arg) for arg in sys.argv[1:]]
+
+    commit = get_commit()
+    machine = platform.node() + " " + platform.machine()
+    old_results = read_results()
+
+    results = run_benchmarks(scales)
+    save_results(results, commit, machine)
+    compare_results(results, old_results, commit, machine)
+    print("Results saved to", results_path)
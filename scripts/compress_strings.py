@@ -0,0 +1,117 @@
+from pathlib import Path
+import sys
+
+from string_table import StringTable, add_ascii_bytes, add_byte_lengths, get_table_name
+from string_pool import translations_path
+from dte_text import build_dictionary, compress_bytes, decompress, get_content, get_dictionary_bytes
+
+dictionary_file_name = "DTE"
+
+
+def read_tables(input_files):
+    '''
+    every table, encoded, with repeats marked (en_length 0)
+    '''
+    return {get_table_name(input_file): add_byte_lengths(add_ascii_bytes(StringTable.read(input_file))) for input_file in input_files}
+
+
+def get_stored_contents(table):
+    '''
+    the strings a table actually stores, without terminators
+    '''
+    return [get_content(table.get_bytes("en_bytes", i)) for i in range(len(table)) if table.integers["en_length"][i] != 0]
+
+
+def get_tables_dictionary(tables):
+    '''
+    one dictionary for every table, since the game only has room for one
+    '''
+    contents = []
+    for table in tables.values():
+        contents += get_stored_contents(table)
+    return build_dictionary(contents)
+
+
+def check_round_trip(tables, dictionary):
+    '''
+    every string has to come back out of the decoder exactly as encode_ascii made it
+    returns (table, row, en_text) for any that don't
+    '''
+    failures = []
+    for table_name, table in tables.items():
+        for i in range(len(table)):
+            en_bytes = table.get_bytes("en_bytes", i)
+            if not en_bytes:
+                continue
+            compressed = compress_bytes(en_bytes, dictionary)
+            if decompress(compressed, dictionary) != get_content(en_bytes) or len(compressed) % 4 != 0:
+                failures.append((table_name, i, table.get("en_text", i)))
+    return failures
+
+
+def get_checked_dictionary(input_files=()):
+    '''
+    the game's one dictionary, always mined from every translation csv, so it's the same whatever gets packed
+    every string in the translations and in input_files has to survive the round trip, or it's a ValueError
+    '''
+    tables = read_tables(sorted(translations_path.glob("*.csv")))
+    dictionary = get_tables_dictionary(tables)
+
+    other_tables = read_tables(input_files)
+    failures = check_round_trip(tables, dictionary) + check_round_trip(other_tables, dictionary)
+    if failures:
+        raise ValueError(str(len(failures)) + " strings don't survive the round trip: "
+                         + ", ".join(table_name + " " + repr(en_text) for table_name, i, en_text in failures))
+    return dictionary
+
+
+def get_savings(tables, dictionary):
+    '''
+    stored bytes per table, before and after compression (padding included)
+    '''
+    savings = {}
+    for table_name, table in tables.items():
+        rows = [i for i in range(len(table)) if table.integers["en_length"][i] != 0]
+        before = sum(len(table.get_bytes("en_bytes", i)) for i in rows)
+        after = sum(len(compress_bytes(table.get_bytes("en_bytes", i), dictionary)) for i in rows)
+        savings[table_name] = (before, after)
+    return savings
+
+
+def print_report(dictionary, savings, failures):
+    print(len(dictionary), "pairs:", " ".join(repr(pair.decode("ascii", errors="replace")) for pair in dictionary))
+
+    total_before = 0
+    total_after = 0
+    for table_name, (before, after) in savings.items():
+        print("   ", table_name + ":", before, "->", after, "bytes, saved", before - after)
+        total_before += before
+        total_after += after
+    print("saved", total_before - total_after, "of", total_before, "bytes, minus", len(get_dictionary_bytes(dictionary)),
+          "for the dictionary")
+
+    if failures:
+        print(len(failures), "strings didn't survive the round trip:")
+        for table_name, i, en_text in failures:
+            print("   ", table_name, i, repr(en_text))
+    else:
+        print("every string survived the round trip")
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python compress_strings.py [output dir]
+    '''
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(".")
+    tables = read_tables(sorted(translations_path.glob("*.csv")))
+    dictionary = get_tables_dictionary(tables)
+
+    failures = check_round_trip(tables, dictionary)
+    print_report(dictionary, get_savings(tables, dictionary), failures)
+
+    if not failures:
+        output_path.mkdir(parents=True, exist_ok=True)
+        (output_path / dictionary_file_name).write_bytes(get_dictionary_bytes(dictionary))
+        print("Created file", dictionary_file_name)
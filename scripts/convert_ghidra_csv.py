@@ -1,7 +1,8 @@
 from pathlib import Path
-import pandas as pd
 import sys
 
+from string_table import StringTable, add_japanese_text
+
 
 def get_input_csv_name(input_file):
     '''
@@ -10,39 +11,13 @@ def get_input_csv_name(input_file):
     return input_file.name
 
 
-def get_dataframe(input_path):
-    '''
-    read in csv file as a pandas dataframe
-    '''
-    df = pd.read_csv(input_path, delimiter="\t", keep_default_na=False, dtype={"en_text": str})
-    print("Read", input_path)
-    return df
-
-
-def add_japanese_text(df):
-    '''
-    add translation column
-    '''
-    df["jp_text"] = df["jp_string"].apply(decode_shift_jis)
-    return df
-
-
-def decode_shift_jis(hex_string):
-    '''
-    convert hex string to bytes, then unicode
-    '''
-    raw_bytes = bytes.fromhex(hex_string)
-    return raw_bytes.decode("shift_jis", errors="replace")
-
-
-def create_new_csv(input_file):
+def create_new_csv(input_file, output_path="."):
     '''
     save new csv with addresses and japanese text (no shift jis)
     '''
-    df = get_dataframe(input_file)
-    df = add_japanese_text(df)
-    output_file_name = get_input_csv_name(input_file)
-    df.to_csv(output_file_name, sep="\t", index=False)
+    table = add_japanese_text(StringTable.read(input_file))
+    output_file_name = Path(output_path) / get_input_csv_name(input_file)
+    table.write(output_file_name)
     print("Created", output_file_name)
 
 
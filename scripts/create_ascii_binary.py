@@ -1,23 +1,128 @@
-from encode_char_tiles import char_width, tile_width, tile_height, row_height, split_into_tiles, encode_tile
+from pathlib import Path
+import numpy as np
+import hashlib
+import json
+import sys
 
-image_paths = ["../tiles/ascii_even.png", "../tiles/ascii_odd.png"]
+from instrument import stage, count
+from encode_char_tiles import char_width, tile_height, row_height, load_sheet, split_sheet, encode_cells, encode_tilesets
 
+# find the tiles relative to this file, so it doesn't matter where we run from
+tiles_path = Path(__file__).resolve().parent.parent / "tiles"
+image_paths = [tiles_path / "ascii_even.png", tiles_path / "ascii_odd.png"]
+n_row_bytes = 1
+tile_size = tile_height * n_row_bytes
 
+
+@stage()
 def write_tiles(file):
     '''
     add encoded tiles to binary file
+    even and odd tiles alternate, so each character gets one of each
     '''
+    data = encode_tilesets(image_paths, char_width, tile_height, row_height, n_row_bytes=n_row_bytes)
+    file.write(data)
+    count("bytes_written", len(data))
+
+
+def get_cache_path(file_name):
+    return Path(str(file_name) + ".cache.json")
+
 
-    tiles = []
+def hash_bytes(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def get_sheet_cells(image_path):
+    '''
+    cut a tileset image into the cells that actually get encoded
+    '''
+    ink = load_sheet(image_path)
+    return split_sheet(ink, char_width, tile_height, row_height, 8 * n_row_bytes)
+
+
+def build_full(file_name):
+    '''
+    encode everything and remember what each cell looked like
+    '''
+    cache = {"sheets": []}
+    tilesets = []
     for image_path in image_paths:
-        tiles.append(split_into_tiles(image_path, char_width, tile_width, tile_height, row_height))
+        cells = get_sheet_cells(image_path)
+        encoded = encode_cells(cells)
+        tilesets.append(encoded)
+        cache["sheets"].append({
+            "file_hash": hash_bytes(Path(image_path).read_bytes()),
+            "cell_hashes": [hash_bytes(cell.tobytes()) for cell in cells],
+            "tiles": [tile.tobytes().hex() for tile in encoded],
+        })
 
-    # tile index
-    for j in range(len(tiles[0])):
-        # tileset index
-        for i in range(2):
-            rows = encode_tile(tiles[i][j], n_row_bytes=1)
-            file.write(b"".join(rows))
+    with open(file_name, "wb") as f:
+        f.write(np.stack(tilesets, axis=1).tobytes())
+    get_cache_path(file_name).write_text(json.dumps(cache))
+
+    print("Binary data written to", file_name)
+
+
+def build_incremental(file_name):
+    '''
+    only re-encode the cells that changed since the last build,
+    then patch the tiles that came out different from the cached ones in the existing file
+    falls back to a full build if there's nothing to compare against, or the file isn't the size the cache says
+    '''
+    cache_path = get_cache_path(file_name)
+    if not Path(file_name).exists() or not cache_path.exists():
+        build_full(file_name)
+        return
+
+    cache = json.loads(cache_path.read_text())
+    n_sets = len(image_paths)
+    if len(cache["sheets"]) != n_sets:
+        build_full(file_name)
+        return
+
+    # every set has a tile for every cell, interleaved
+    expected_size = sum(len(sheet_cache["tiles"]) for sheet_cache in cache["sheets"]) * tile_size
+    if Path(file_name).stat().st_size != expected_size:
+        build_full(file_name)
+        return
+
+    patches = [] # (position in file, tile bytes)
+    for i, image_path in enumerate(image_paths):
+        sheet_cache = cache["sheets"][i]
+
+        # whole file unchanged, don't even decode the png
+        file_hash = hash_bytes(Path(image_path).read_bytes())
+        if file_hash == sheet_cache["file_hash"]:
+            continue
+
+        cells = get_sheet_cells(image_path)
+        if len(cells) != len(sheet_cache["cell_hashes"]):
+            build_full(file_name)
+            return
+
+        cell_hashes = [hash_bytes(cell.tobytes()) for cell in cells]
+        changed = [j for j, cell_hash in enumerate(cell_hashes) if cell_hash != sheet_cache["cell_hashes"][j]]
+        if changed:
+            encoded = encode_cells(cells[changed])
+            for j, tile in zip(changed, encoded):
+                # a cell can change without its tile changing (say, ink past the edge of the tile)
+                tile_bytes = tile.tobytes()
+                if tile_bytes.hex() == sheet_cache["tiles"][j]:
+                    continue
+                sheet_cache["tiles"][j] = tile_bytes.hex()
+                patches.append(((j * n_sets + i) * tile_size, tile_bytes))
+
+        sheet_cache["file_hash"] = file_hash
+        sheet_cache["cell_hashes"] = cell_hashes
+
+    with open(file_name, "r+b") as f:
+        for position, tile_bytes in sorted(patches):
+            f.seek(position)
+            f.write(tile_bytes)
+    cache_path.write_text(json.dumps(cache))
+
+    print("Patched", len(patches), "tiles in", file_name)
 
 
 
@@ -26,8 +131,7 @@ if __name__ == "__main__":
 
     file_name = "ASCII"
 
-    file = open(file_name, "wb")
-    write_tiles(file)
-    file.close()
-
-    print("Binary data written to", file_name)
+    if "--incremental" in sys.argv[1:]:
+        build_incremental(file_name)
+    else:
+        build_full(file_name)
@@ -1,5 +1,11 @@
+from pathlib import Path
+import numpy as np
+import hashlib
 import re
 
+from rom_image import RomImage
+from instrument import stage
+
 # path to exe file from the rom
 # all of the tile data is in here
 rom_path = "../rom/SLPS_004.76"
@@ -13,141 +19,200 @@ tile_table_nonkanji = 514840
 tile_table_kanji = 528464
 tile_table_english = 1589248
 
+tile_tables = {
+    "nonkanji": tile_table_nonkanji,
+    "kanji": tile_table_kanji,
+    "english": tile_table_english,
+}
 
-def remap_shift_jis_char(shift_jis_code, rom_file):
-    '''
-    transforms a shift jis code into some kind of index number used by the rom
-    transliterated from ghidra pseudocode (with some cleanup)
-    '''
-    code_bytes = shift_jis_code.to_bytes(2, byteorder="big")
-    byte1 = code_bytes[0]
-    byte2 = code_bytes[1]
+# every nonkanji slot between the two tile tables
+n_glyphs_nonkanji = (tile_table_kanji - tile_table_nonkanji) // 26
+
+# 2-bit value -> the two pixels it stands for, ink is 1
+# the high bit is the left pixel
+raw_pair_pixels = np.array([[0, 0], [0, 1], [1, 0], [1, 1]], dtype=np.uint8)
 
-    # ascii (only care about first byte)
-    if byte1 < 0x81:
-        table_chunk_index = 0xf # match capital cyrillic
-        shift_jis_code = 0x839f - 0x20 + byte1
 
+# shift jis -> chunk table lookup, transliterated from ghidra pseudocode (with some cleanup)
+# (first byte, second byte start, second byte end, chunk table, chunk index, codes skipped)
+# second byte ranges don't include the end, and 0x7f is never a valid second byte
+shift_jis_chunk_ranges = [
     # shift jis symbol table
-    elif byte1 == 0x81:
-        if byte2 < 0x7f: # "normal" punctuation
-            table_chunk_index = 0
-        elif byte2 < 0xad: # math symbols and shapes
-            table_chunk_index = 1
-        elif byte2 < 0xc0: # math cup symbols
-            table_chunk_index = 2
-        elif byte2 < 0xcf: # more math symbols
-            table_chunk_index = 3
-        elif byte2 < 0xe9: # even more math symbols, for your vector calculus needs
-            table_chunk_index = 4
-        elif byte2 < 0xf8: # random symbols
-            table_chunk_index = 5
-        elif byte2 == 0xfc: # the circle
-            table_chunk_index = 6
-        else: # invalid
-            return -1
+    (0x81, 0x40, 0x7f, chunk_table_nonkanji, 0, 0), # "normal" punctuation
+    (0x81, 0x80, 0xad, chunk_table_nonkanji, 1, 0), # math symbols and shapes
+    (0x81, 0xad, 0xc0, chunk_table_nonkanji, 2, 0), # math cup symbols
+    (0x81, 0xc0, 0xcf, chunk_table_nonkanji, 3, 0), # more math symbols
+    (0x81, 0xcf, 0xe9, chunk_table_nonkanji, 4, 0), # even more math symbols, for your vector calculus needs
+    (0x81, 0xe9, 0xf8, chunk_table_nonkanji, 5, 0), # random symbols
+    (0x81, 0xfc, 0xfd, chunk_table_nonkanji, 6, 0), # the circle
 
     # latin and hiragana
-    elif byte1 == 0x82:
-        if byte2 < 0x59: # numbers
-            table_chunk_index = 7
-        elif byte2 < 0x7a: # capital latin
-            table_chunk_index = 8
-        elif byte2 < 0x9b: # lowercase latin
-            table_chunk_index = 9
-        elif byte2 < 0xf2: # hiragana
-            table_chunk_index = 10
-        else:
-            return -1
+    (0x82, 0x40, 0x59, chunk_table_nonkanji, 7, 0), # numbers
+    (0x82, 0x59, 0x7a, chunk_table_nonkanji, 8, 0), # capital latin
+    (0x82, 0x7a, 0x7f, chunk_table_nonkanji, 9, 0), # lowercase latin
+    (0x82, 0x80, 0x9b, chunk_table_nonkanji, 9, 0),
+    (0x82, 0x9b, 0xf2, chunk_table_nonkanji, 10, 0), # hiragana
 
     # katakana and greek
-    elif byte1 == 0x83:
-        if byte2 < 0x7f: # katakana 1
-            table_chunk_index = 0xb
-        elif byte2 < 0x97: # katakana 2
-            table_chunk_index = 0xc
-        elif byte2 < 0xb7: # capital greek
-            table_chunk_index = 0xd
-        elif byte2 < 0xd7: # lowercase greek
-            table_chunk_index = 0xe
-        else:
-            return -1
+    (0x83, 0x40, 0x7f, chunk_table_nonkanji, 0xb, 0), # katakana 1
+    (0x83, 0x80, 0x97, chunk_table_nonkanji, 0xc, 0), # katakana 2
+    (0x83, 0x97, 0xb7, chunk_table_nonkanji, 0xd, 0), # capital greek
+    (0x83, 0xb7, 0xd7, chunk_table_nonkanji, 0xe, 0), # lowercase greek
 
     # cyrillic and box drawing
-    elif byte1 == 0x84:
-        if byte2 < 0x61: # capital cyrillic
-            table_chunk_index = 0xf
-        elif byte2 < 0x7f: # lowercase cyrillic 1
-            table_chunk_index = 0x10
-        elif byte2 < 0x92: # lowercase cyrillic 2
-            table_chunk_index = 0x11
-        elif byte2 < 0xbf: # box drawing
-            table_chunk_index = 0x12
-        else:
-            table_chunk_index = 0 # why not return -1?  who knows
+    (0x84, 0x40, 0x61, chunk_table_nonkanji, 0xf, 0), # capital cyrillic
+    (0x84, 0x61, 0x7f, chunk_table_nonkanji, 0x10, 0), # lowercase cyrillic 1
+    (0x84, 0x80, 0x92, chunk_table_nonkanji, 0x11, 0), # lowercase cyrillic 2
+    (0x84, 0x92, 0xbf, chunk_table_nonkanji, 0x12, 0), # box drawing
+    (0x84, 0xbf, 0xfd, chunk_table_nonkanji, 0, 0), # why not invalid?  who knows
+
+    # second symbols table, but these tiles aren't in the game
+    (0x87, 0x40, 0x5b, chunk_table_forbidden, 0x10, 0),
+    (0x87, 0x5b, 0x63, chunk_table_forbidden, 0x11, 0),
+    (0x87, 0x63, 0x7f, chunk_table_forbidden, 0x12, 0),
+    (0x87, 0x80, 0x96, chunk_table_forbidden, 0x12, 0),
+
+    # kanji, one chunk per first byte
+    # the first row starts late, and every other row skips over 0x7f
+    (0x88, 0x9f, 0xfd, chunk_table_kanji, 0, 0),
+]
+for byte1 in range(0x89, 0x99):
+    shift_jis_chunk_ranges.append((byte1, 0x40, 0x7f, chunk_table_kanji, byte1 - 0x88, 0))
+    shift_jis_chunk_ranges.append((byte1, 0x80, 0xfd, chunk_table_kanji, byte1 - 0x88, 1))
+
+# where the precomputed lookup tables are saved, keyed by the rom's hash
+cache_path = Path(__file__).resolve().parent.parent / "rom" / "cache"
+
+# bump this whenever build_shift_jis_table or build_inverse_shift_jis_tables changes what it makes,
+# so old cache files stop getting used (the ranges above are hashed into the name too)
+# 2: 0x87xx codes are in the nonkanji inverse table, not kanji
+cache_version = 2
+
+
+def read_chunk(rom, chunk_table, chunk_index):
+    '''
+    each chunk table entry is 2 words: first shift jis code in the chunk, then its tile index
+    '''
+    i = 4 * chunk_index
+    return rom.read_u16(chunk_table + i), rom.read_u16(chunk_table + i + 2)
+
+
+def build_shift_jis_table(rom):
+    '''
+    remap every possible shift jis code to a tile index in one go
+    -1 means the code doesn't have a tile
+    '''
+    codes = np.arange(0x10000, dtype=np.int32)
+    code_to_tile = np.full(0x10000, -1, dtype=np.int32)
+
+    # ascii (only care about first byte), matched to capital cyrillic
+    # the first byte is still ascii when the chunk table gets picked, so it's the kanji one
+    base_code, chunk_offset = read_chunk(rom, chunk_table_kanji, 0xf)
+    ascii_codes = 0x839f - 0x20 + (codes[:0x8100] >> 8)
+    code_to_tile[:0x8100] = ascii_codes - base_code + chunk_offset
 
     # forbidden tables
-    # deceptively complex—none of these are in the game
-    elif byte1 == 0x85:
-        return shift_jis_code - 0x8500
-
-    # second symbols table, but these tiles aren't in the game either
-    elif byte1 == 0x87:
-        if byte2 < 0x5b:
-            table_chunk_index = 0x10
-        elif byte2 < 0x63:
-            table_chunk_index = 0x11
-        elif byte2 < 0x96:
-            table_chunk_index = 0x12
-        else:
-            return -1
-
-    # kanji
-    elif byte1 < 0x99:
-        if byte2 == 0x7f or (byte2 < 0x9f and byte1 == 0x88) or byte2 > 0xfc:
-            return -1
-        else:
-            table_chunk_index = byte1 - 0x88
-
-    # after shift jis tables
-    else:
-        return -1
+    # deceptively complex—none of these are in the game, so they point at the english tiles
+    code_to_tile[0x8500:0x8600] = codes[0x8500:0x8600] - 0x8500
+
+    # 0x86xx isn't in any range, so it stays -1
+    # (the old if/elif chain sent it down the kanji branch with chunk index -2, reading whatever is before the kanji chunk table)
+
+    for byte1, start, end, chunk_table, chunk_index, n_skipped in shift_jis_chunk_ranges:
+        base_code, chunk_offset = read_chunk(rom, chunk_table, chunk_index)
+        first_code = (byte1 << 8) + start
+        last_code = (byte1 << 8) + end
+        code_to_tile[first_code:last_code] = codes[first_code:last_code] - base_code + chunk_offset - n_skipped
+
+    # a code before the start of its chunk can't have a tile
+    code_to_tile[code_to_tile < 0] = -1
+
+    return code_to_tile
 
-    # prepare to get offset
-    i = 4 * table_chunk_index
 
-    # nonkanji
-    if 0x81 <= byte1 <= 0x84:
-        chunk_offset = get_int_from_file(chunk_table_nonkanji + i + 2, 2, rom_file)
-        adjusted_code = shift_jis_code - get_int_from_file(chunk_table_nonkanji + i, 2, rom_file)
+def get_tile_table_name(shift_jis_code):
+    '''
+    which tile table a code's tile index points into
+    '''
+    if 0x84ff < shift_jis_code < 0x8600:
+        return "english"
+    if shift_jis_code < 0x8800:
+        return "nonkanji"
+    return "kanji"
+
+
+def build_inverse_shift_jis_tables(code_to_tile):
+    '''
+    tile index -> shift jis code, one array per tile table
+    ascii codes are left out since they just borrow other tiles
+    if more than one code shares a tile, the lowest one wins
+    '''
+    inverse_tables = {}
+    codes = np.arange(0x8100, 0x10000, dtype=np.int32)
+    table_names = np.where(codes < 0x8800, "nonkanji", "kanji")
+    table_names[(0x8500 <= codes) & (codes < 0x8600)] = "english"
+
+    for table_name in tile_tables:
+        mask = (table_names == table_name) & (code_to_tile[0x8100:] >= 0)
+        tiles = code_to_tile[0x8100:][mask]
 
-    # forbidden
-    elif 0x85 <= byte1 <= 0x87:
-        chunk_offset = get_int_from_file(chunk_table_forbidden + i + 2, 2, rom_file)
-        adjusted_code = shift_jis_code - get_int_from_file(chunk_table_forbidden + i, 2, rom_file)
+        # np.unique returns the first (lowest) code for every tile
+        tiles, first_indices = np.unique(tiles, return_index=True)
+        n_tiles = tiles[-1] + 1 if len(tiles) else 0
+        inverse = np.full(n_tiles, -1, dtype=np.int32)
+        inverse[tiles] = codes[mask][first_indices]
+        inverse_tables[table_name] = inverse
+
+    return inverse_tables
+
+
+def get_cache_file_name(rom):
+    '''
+    keyed by the rom, the cache format, and the chunk ranges the tables were built from
+    '''
+    ranges_hash = hashlib.sha1(repr(shift_jis_chunk_ranges).encode()).hexdigest()[:8]
+    return "shift_jis_v" + str(cache_version) + "_" + ranges_hash + "_" + rom.get_hash() + ".npz"
+
+
+@stage()
+def get_shift_jis_tables(rom):
+    '''
+    get the lookup table and its inverses, building and caching them if needed
+    they stick around on the rom, and on disk next to it
+    '''
+    if "shift_jis" in rom.cache:
+        return rom.cache["shift_jis"]
 
-    # kanji
+    file_path = Path(cache_path) / get_cache_file_name(rom)
+    if file_path.exists():
+        with np.load(file_path) as data:
+            tables = {name: data[name] for name in data.files}
     else:
-        chunk_offset = get_int_from_file(chunk_table_kanji + i + 2, 2, rom_file)
-        adjusted_code = shift_jis_code - get_int_from_file(chunk_table_kanji + i, 2, rom_file)
+        code_to_tile = build_shift_jis_table(rom)
+        tables = build_inverse_shift_jis_tables(code_to_tile)
+        tables["code_to_tile"] = code_to_tile
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(file_path, **tables)
 
-        # correct for unused shift jis codes
-        # this is so gross but i can't come up with a more clever way
-        if byte1 >= 0x89 and byte2 > 0x7f:
-            adjusted_code -= 1
-        if byte1 >= 0x8a:
-            adjusted_code -= get_weird_kanji_offset(byte1)
+    rom.cache["shift_jis"] = tables
+    return tables
 
-    return adjusted_code + chunk_offset
 
+def remap_shift_jis_char(shift_jis_code, rom):
+    '''
+    transforms a shift jis code into some kind of index number used by the rom
+    '''
+    return int(get_shift_jis_tables(rom)["code_to_tile"][shift_jis_code])
 
-def get_int_from_file(position, n_bytes, file):
+
+def get_tile_shift_jis_char(table_name, tile_index, rom):
     '''
-    return an int from some bytes at the specified position in the file
+    which shift jis code lives in a tile slot, or -1 if none does
     '''
-    file.seek(position)
-    value = file.read(n_bytes)
-    return int.from_bytes(value, byteorder="little")
+    inverse = get_shift_jis_tables(rom)[table_name]
+    if tile_index >= len(inverse):
+        return -1
+    return int(inverse[tile_index])
 
 
 def decode_shift_jis(shift_jis_code):
@@ -161,51 +226,100 @@ def decode_shift_jis(shift_jis_code):
         return ""
 
 
-def get_char_tile_start_address(shift_jis_code, rom_file, n_row_bytes=2):
+def get_char_tile_start_address(shift_jis_code, rom, n_row_bytes=2):
     '''
     find the first byte of the tile to be decoded
     each tile is 13 rows with 2 bytes per row, hence 0x1a (26)
     '''
-    remapped_shift_jis = remap_shift_jis_char(shift_jis_code, rom_file)
-
-    if shift_jis_code < 0x8800:
-        tile_table_base = tile_table_nonkanji
-    else:
-        tile_table_base = tile_table_kanji
-    if 0x84ff < shift_jis_code < 0x8600:
-        tile_table_base = tile_table_english
+    remapped_shift_jis = remap_shift_jis_char(shift_jis_code, rom)
+    tile_table_base = tile_tables[get_tile_table_name(shift_jis_code)]
 
     return tile_table_base + 13 * n_row_bytes * remapped_shift_jis
 
 
-def read_in_char_string(shift_jis_bytestring, rom_file, color_index=0, n_row_bytes=2):
+@stage()
+def read_in_char_string(shift_jis_bytestring, rom, color_index=0, n_row_bytes=2):
     '''
     read in a string of shift_jis bytes and get the decoded tiles as binary
     obvs we need the rom for this
     '''
     i = 0 # current char index
     result = []
-    color_offset = 4 * color_index
+
+    # the color table only has 4 entries per color, so grab them all at once
+    colors = rom.slice(text_color_table + 4 * color_index, 4)
 
     while i < len(shift_jis_bytestring) and shift_jis_bytestring[i] != 0:
         shift_jis_code = int.from_bytes(shift_jis_bytestring[i:i+2], byteorder="big")
-        address = get_char_tile_start_address(shift_jis_code, rom_file)
-
-        for row in range(13):
-            for row_byte in range(n_row_bytes):
-                value = get_int_from_file(address, 1, rom_file)
-                for pixel_bit in range(6, -2, -2):
-                    pixel_bit_index = (value >> pixel_bit) & 3 # magic
-                    pixel_bit_index = pixel_bit_index + text_color_table + color_offset
-                    pixel_byte = get_int_from_file(pixel_bit_index, 1, rom_file)
-                    result.append(pixel_byte)
-
-                address += 1
+        address = get_char_tile_start_address(shift_jis_code, rom)
+
+        for value in rom.slice(address, 13 * n_row_bytes):
+            for pixel_bit in range(6, -2, -2):
+                pixel_bit_index = (value >> pixel_bit) & 3 # magic
+                result.append(colors[pixel_bit_index])
+
         i += 2
 
     return bytes(result)
 
 
+def get_pixel_lookup_table(pair_pixels):
+    '''
+    build a 256 entry table that expands one tile byte into 8 pixels
+    each byte holds 4 2-bit values (high bits first), and each value is 2 pixels
+    '''
+    values = np.arange(256)[:, np.newaxis]
+    pair_indices = (values >> np.array([6, 4, 2, 0])) & 3
+    return pair_pixels[pair_indices].reshape(256, 8)
+
+
+def get_palette_pair_pixels(rom, color_index):
+    '''
+    look up the 4 color table bytes for a color
+    each byte is 2 4bpp pixels, low nibble on the left
+    '''
+    colors = np.frombuffer(rom.slice(text_color_table + 4 * color_index, 4), dtype=np.uint8)
+    return np.stack([colors & 0xf, colors >> 4], axis=1)
+
+
+@stage()
+def decode_tile_range(rom, tile_table_base, start_index, n_glyphs, color_index=None, n_row_bytes=2):
+    '''
+    decode a bunch of consecutive tiles from one of the tile tables at once
+    returns an (n_glyphs, 13, 8 * n_row_bytes) array
+    without a color index the pixels are 0 or 1, with one they are 4bpp palette indices
+    '''
+    if color_index is None:
+        pair_pixels = raw_pair_pixels
+    else:
+        pair_pixels = get_palette_pair_pixels(rom, color_index)
+
+    tile_size = 13 * n_row_bytes
+    tile_data = rom.slice(tile_table_base + tile_size * start_index, tile_size * n_glyphs)
+
+    return decode_tile_bytes(np.frombuffer(tile_data, dtype=np.uint8), n_row_bytes, pair_pixels)
+
+
+def decode_tile_bytes(tile_bytes, n_row_bytes=2, pair_pixels=raw_pair_pixels, tile_height=13):
+    '''
+    decode an array of encoded tiles that didn't come from the rom (say, fresh from the encoder)
+    returns an (n_tiles, tile_height, 8 * n_row_bytes) array
+    '''
+    lookup_table = get_pixel_lookup_table(pair_pixels)
+    tile_bytes = np.asarray(tile_bytes, dtype=np.uint8).reshape(-1, tile_height, n_row_bytes)
+    n_tiles = tile_bytes.shape[0]
+
+    return lookup_table[tile_bytes].reshape(n_tiles, tile_height, 8 * n_row_bytes)
+
+
+def get_changed_tiles(old_tiles, new_tiles):
+    '''
+    compare two decoded tile arrays (say, from two builds)
+    return the indices of the tiles that are different
+    '''
+    return np.flatnonzero((old_tiles != new_tiles).any(axis=(1, 2)))
+
+
 def hex_to_bytes(hex_string):
     '''
     convert a string of hex numbers into a bytestring
@@ -289,13 +403,13 @@ if __name__ == "__main__":
     '''
     attempt to print all tiles in the shift_jis range, even the ones that don't exist)
     '''
-    rom_file = open(rom_path, "rb")
+    rom = RomImage(rom_path)
 
     for code in range(0x8260, 0x8280):
         print(hex(code), decode_shift_jis(code))
         code_bytes = code.to_bytes(2, byteorder="big")
-        tile_bytes = read_in_char_string(code_bytes, rom_file, color_index=2)
+        tile_bytes = read_in_char_string(code_bytes, rom, color_index=2)
         print_tile(process_tile(tile_bytes))
         print("")
 
-    rom_file.close()
+    rom.close()
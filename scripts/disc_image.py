@@ -0,0 +1,365 @@
+from pathlib import Path
+import numpy as np
+import mmap
+import sys
+import re
+
+# raw cd sectors, mode 2 form 1 (what the playstation uses for files)
+# sync (12) + header (4) + subheader (8) + user data (2048) + edc (4) + ecc (276)
+sector_size = 2352
+user_data_size = 2048
+header_offset = 0xc
+subheader_offset = 0x10
+user_data_offset = 0x18
+edc_offset = 0x818
+ecc_p_offset = 0x81c
+ecc_q_offset = 0x8c8
+
+# mode 1 sectors have no subheader, so their data starts earlier
+mode_1_user_data_offset = 0x10
+sync_pattern = b"\x00" + b"\xff" * 10 + b"\x00"
+
+# iso9660
+primary_volume_descriptor_lba = 16
+root_record_offset = 156
+
+# how many sectors iter_file hands back at a time
+stream_sectors = 256
+
+# where the exe is on the disc
+exe_path = "SLPS_004.76"
+
+
+def get_bin_path(path):
+    '''
+    accept either the .bin or its .cue (just use the first FILE line)
+    '''
+    path = Path(path)
+    if path.suffix.lower() != ".cue":
+        return path
+
+    match = re.search(r'FILE\s+"(.+?)"\s+BINARY', path.read_text(), re.IGNORECASE)
+    if match is None:
+        raise ValueError("no BINARY FILE line in " + str(path))
+    return path.parent / match.group(1)
+
+
+def is_disc_image(path):
+    '''
+    a cue sheet, raw sectors (they start with the sync pattern) or an iso (CD001 in the volume descriptor)
+    going by the contents, since exes and ghidra exports are often .bin too
+    '''
+    path = Path(path)
+    if path.suffix.lower() == ".cue":
+        return True
+    with open(path, "rb") as f:
+        start = f.read(len(sync_pattern))
+        f.seek(primary_volume_descriptor_lba * user_data_size + 1)
+        iso_id = f.read(5)
+    return start == sync_pattern or iso_id == b"CD001"
+
+
+def parse_directory_record(data, position):
+    '''
+    (name, lba, size, is directory, record length) for the directory record at position
+    '''
+    length = data[position]
+    lba = int.from_bytes(data[position + 2:position + 6], "little")
+    size = int.from_bytes(data[position + 10:position + 14], "little")
+    is_directory = bool(data[position + 25] & 2)
+    name_length = data[position + 32]
+    name = data[position + 33:position + 33 + name_length].decode("ascii", errors="replace")
+    return name, lba, size, is_directory, length
+
+
+def parse_directory(data):
+    '''
+    list the records in a directory's data as name -> (lba, size, is directory)
+    file names lose their ";1" version suffix
+    '''
+    records = {}
+    position = 0
+    while position < len(data):
+        # records never cross a sector boundary, so a zero length means skip to the next sector
+        if data[position] == 0:
+            position = (position // user_data_size + 1) * user_data_size
+            continue
+        name, record_lba, record_size, is_directory, length = parse_directory_record(data, position)
+        if name not in ("\x00", "\x01"):
+            records[name.split(";")[0]] = (record_lba, record_size, is_directory)
+        position += length
+    return records
+
+
+class DiscImage:
+    '''
+    read-only view of a disc image (.bin, .cue or .iso), mapped into memory once
+    directories are only parsed when a path goes through them, and then remembered,
+    so opening one file costs a few sector reads no matter how big the disc is
+    '''
+
+    def __init__(self, path):
+        self.path = get_bin_path(path)
+        self.file = open(self.path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # raw 2352 byte sectors start with the sync pattern, a plain .iso is just the 2048 byte user data
+        if self.map[:len(sync_pattern)] == sync_pattern:
+            self.sector_size = sector_size
+            mode = self.map[primary_volume_descriptor_lba * sector_size + header_offset + 3]
+            self.user_data_offset = mode_1_user_data_offset if mode == 1 else user_data_offset
+        else:
+            self.sector_size = user_data_size
+            self.user_data_offset = 0
+        self.n_sectors = len(self.map) // self.sector_size
+
+        pvd = self.read_sectors(primary_volume_descriptor_lba)
+        if pvd[1:6] != b"CD001":
+            raise ValueError("no iso9660 primary volume descriptor in " + str(self.path))
+        _, lba, size, _, _ = parse_directory_record(pvd, root_record_offset)
+
+        self.root = (lba, size, True)
+        self.directories = {} # directory path -> its records, filled in as they get used
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def read_sectors(self, lba, n_sectors=1):
+        '''
+        the user data of some sectors, straight out of the map
+        '''
+        if lba + n_sectors > self.n_sectors:
+            raise ValueError("sectors " + str(lba) + "-" + str(lba + n_sectors - 1) + " are past the end of the disc")
+        if self.sector_size == user_data_size:
+            return self.map[lba * user_data_size:(lba + n_sectors) * user_data_size]
+
+        sectors = np.frombuffer(self.map, dtype=np.uint8, count=n_sectors * sector_size,
+                                offset=lba * sector_size).reshape(n_sectors, sector_size)
+        return sectors[:, self.user_data_offset:self.user_data_offset + user_data_size].tobytes()
+
+    def get_directory(self, directory_path, lba, size):
+        if directory_path not in self.directories:
+            data = self.read_sectors(lba, -(-size // user_data_size))[:size]
+            self.directories[directory_path] = parse_directory(data)
+        return self.directories[directory_path]
+
+    def get_entry(self, file_path):
+        '''
+        (lba, size, is directory) for a path like "SLPS_004.76" or "DATA/MAP.BIN"
+        '''
+        lba, size, is_directory = self.root
+        directory_path = ""
+        for name in file_path.strip("/").upper().split("/"):
+            if not name:
+                continue
+            if not is_directory:
+                raise FileNotFoundError(file_path + " is not on the disc")
+            records = self.get_directory(directory_path, lba, size)
+            if name not in records:
+                raise FileNotFoundError(file_path + " is not on the disc")
+            lba, size, is_directory = records[name]
+            directory_path += "/" + name
+        return lba, size, is_directory
+
+    def list_files(self, directory_path=""):
+        '''
+        every file under a directory as path -> (lba, size), this one does read the whole tree
+        '''
+        lba, size, _ = self.get_entry(directory_path)
+        directory_path = directory_path.strip("/").upper()
+        files = {}
+        for name, (record_lba, record_size, is_directory) in self.get_directory("/" + directory_path if directory_path else "", lba, size).items():
+            path = directory_path + "/" + name if directory_path else name
+            if is_directory:
+                files.update(self.list_files(path))
+            else:
+                files[path] = (record_lba, record_size)
+        return files
+
+    def iter_file(self, file_path):
+        '''
+        a file's contents a few sectors at a time, without reading anything else
+        (form 2 files like xa audio only come out as their first 2048 bytes per sector)
+        '''
+        lba, size, is_directory = self.get_entry(file_path)
+        if is_directory:
+            raise IsADirectoryError(file_path + " is a directory")
+
+        n_sectors = -(-size // user_data_size)
+        for first in range(0, n_sectors, stream_sectors):
+            n = min(stream_sectors, n_sectors - first)
+            data = self.read_sectors(lba + first, n)
+            yield data[:size - first * user_data_size]
+
+    def read_file(self, file_path):
+        return b"".join(self.iter_file(file_path))
+
+    def extract_file(self, file_path, output_file):
+        '''
+        stream one file to disk, returns its size
+        '''
+        n_bytes = 0
+        with open(output_file, "wb") as f:
+            for data in self.iter_file(file_path):
+                f.write(data)
+                n_bytes += len(data)
+        return n_bytes
+
+
+def get_edc_table():
+    '''
+    crc table for the edc, polynomial 0xd8018001 (reversed)
+    '''
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ np.uint32(0xd8018001), table >> 1).astype(np.uint32)
+    return table
+
+
+def get_ecc_tables():
+    '''
+    multiply-by-2 and its inverse in GF(2^8) with polynomial 0x11d
+    '''
+    forward = np.zeros(256, dtype=np.uint8)
+    backward = np.zeros(256, dtype=np.uint8)
+    for i in range(256):
+        j = (i << 1) ^ (0x11d if i & 0x80 else 0)
+        forward[i] = j
+        backward[i ^ j] = i
+    return forward, backward
+
+
+edc_table = get_edc_table()
+ecc_forward, ecc_backward = get_ecc_tables()
+
+
+def compute_edc(data):
+    '''
+    edc for many sectors at once: data is (n_sectors, n_bytes)
+    the crc is serial within a sector, so step through the bytes and do all the sectors together
+    '''
+    crc = np.zeros(data.shape[0], dtype=np.uint32)
+    for column in data.T:
+        crc = (crc >> 8) ^ edc_table[(crc ^ column) & 0xff]
+    return crc
+
+
+def get_ecc_indices(major_count, minor_count, major_mult, minor_inc):
+    '''
+    which bytes (counting from the header) feed each parity pair, in order
+    '''
+    size = major_count * minor_count
+    indices = np.zeros((major_count, minor_count), dtype=np.int64)
+    for major in range(major_count):
+        index = (major >> 1) * major_mult + (major & 1)
+        for minor in range(minor_count):
+            indices[major, minor] = index
+            index = (index + minor_inc) % size
+    return indices
+
+
+ecc_p_indices = get_ecc_indices(86, 24, 2, 86)
+ecc_q_indices = get_ecc_indices(52, 43, 86, 88)
+
+
+def compute_ecc_block(data, indices):
+    '''
+    reed-solomon parity for many sectors at once
+    returns (n_sectors, 2 * major_count)
+    '''
+    ecc_a = np.zeros((data.shape[0], indices.shape[0]), dtype=np.uint8)
+    ecc_b = np.zeros_like(ecc_a)
+    for minor in range(indices.shape[1]):
+        values = data[:, indices[:, minor]]
+        ecc_a = ecc_forward[ecc_a ^ values]
+        ecc_b ^= values
+    ecc_a = ecc_backward[ecc_forward[ecc_a] ^ ecc_b]
+    return np.concatenate([ecc_a, ecc_a ^ ecc_b], axis=1)
+
+
+def rebuild_sectors(sectors):
+    '''
+    recompute edc and ecc for an (n_sectors, 2352) array of mode 2 form 1 sectors in place
+    '''
+    edc = compute_edc(sectors[:, subheader_offset:edc_offset])
+    sectors[:, edc_offset:ecc_p_offset] = edc.astype("<u4").view(np.uint8).reshape(-1, 4)
+
+    # for mode 2 the header counts as zeros when computing the ecc
+    header = sectors[:, header_offset:subheader_offset].copy()
+    sectors[:, header_offset:subheader_offset] = 0
+    sectors[:, ecc_p_offset:ecc_q_offset] = compute_ecc_block(sectors[:, header_offset:], ecc_p_indices)
+    sectors[:, ecc_q_offset:] = compute_ecc_block(sectors[:, header_offset:], ecc_q_indices)
+    sectors[:, header_offset:subheader_offset] = header
+
+    return sectors
+
+
+def patch_file(disc_path, file_path, new_data):
+    '''
+    replace a file on the disc image in place, rewriting only the sectors whose data changed
+    the new file has to be the same size as the old one
+    '''
+    with DiscImage(disc_path) as disc:
+        lba, size, is_directory = disc.get_entry(file_path)
+        if is_directory:
+            raise IsADirectoryError(file_path + " is a directory")
+        if len(new_data) != size:
+            raise ValueError(file_path + " is " + str(size) + " bytes on the disc, new one is " + str(len(new_data)))
+        if disc.sector_size != sector_size:
+            raise ValueError(str(disc.path) + " has no raw sectors, only a .bin can be patched")
+
+        n_sectors = -(-size // user_data_size)
+        if lba + n_sectors > disc.n_sectors:
+            raise ValueError(file_path + " runs past the end of the disc")
+        sectors = np.frombuffer(disc.map, dtype=np.uint8, count=n_sectors * sector_size,
+                                offset=lba * sector_size).reshape(n_sectors, sector_size).copy()
+        bin_path = disc.path
+
+    modes = sectors[:, header_offset + 3]
+    forms = sectors[:, subheader_offset + 2] & 0x20
+    if (modes != 2).any() or forms.any():
+        raise ValueError(file_path + " is not stored in mode 2 form 1 sectors")
+
+    # pad the last sector out with zeros, like a fresh build would
+    padded = np.zeros(n_sectors * user_data_size, dtype=np.uint8)
+    padded[:size] = np.frombuffer(new_data, dtype=np.uint8)
+    padded = padded.reshape(n_sectors, user_data_size)
+
+    user_data = sectors[:, user_data_offset:user_data_offset + user_data_size]
+    changed = np.flatnonzero((user_data != padded).any(axis=1))
+    if len(changed) == 0:
+        return changed
+
+    sectors[changed, user_data_offset:user_data_offset + user_data_size] = padded[changed]
+    rebuilt = rebuild_sectors(sectors[changed])
+
+    # the disc image is only mapped for reading, so the new sectors go in through a file of their own
+    with open(bin_path, "r+b") as bin_file:
+        for sector_index, sector in zip(changed, rebuilt):
+            bin_file.seek((lba + sector_index) * sector_size)
+            bin_file.write(sector.tobytes())
+
+    return changed
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python disc_image.py <disc .bin, .cue or .iso> [file on disc ...]
+    lists every file, or copies the ones given into the current directory
+    '''
+    with DiscImage(sys.argv[1]) as disc:
+        if len(sys.argv) == 2:
+            for file_path, (lba, size) in sorted(disc.list_files().items()):
+                print(format(lba, ">8"), format(size, ">10"), file_path)
+        for file_path in sys.argv[2:]:
+            n_bytes = disc.extract_file(file_path, Path(file_path).name)
+            print("Extracted", file_path, "(" + str(n_bytes), "bytes)")
@@ -0,0 +1,139 @@
+from collections import Counter, defaultdict
+import heapq
+
+# dual tile encoding: one byte that stands for two
+# encode_ascii only ever makes bytes below 0x80, so the halfwidth katakana bytes are free to use
+# code first_code + i is entry i of the dictionary, at most n_codes of them
+first_code = 0xa0
+n_codes = 0x40
+
+# every dictionary entry takes 2 bytes in the exe, so a pair has to save more than that
+entry_size = 2
+
+
+def get_content(en_bytes):
+    '''
+    an encoded string without its terminator and padding
+    '''
+    return en_bytes[:en_bytes.index(b"\x00")]
+
+
+def terminate(content):
+    '''
+    add the terminator and pad to a word, same as encode_ascii
+    '''
+    content += b"\x00"
+    return content + bytes(-len(content) % 4)
+
+
+def get_pairs(content):
+    '''
+    every pair of adjacent plain bytes (pairs never contain a code, so the decoder never has to recurse)
+    counted the way replace finds them, left to right without overlapping, so "aaa" only has one "aa"
+    '''
+    pairs = []
+    last_starts = {}
+    for i in range(len(content) - 1):
+        if content[i] >= first_code or content[i + 1] >= first_code:
+            continue
+        pair = content[i:i + 2]
+        if last_starts.get(pair) == i - 1:
+            continue
+        last_starts[pair] = i
+        pairs.append(pair)
+    return pairs
+
+
+def build_dictionary(contents, max_entries=n_codes):
+    '''
+    pick the pairs that save the most bytes, one at a time
+    a heap keeps the best pair on top; counts go stale as strings get rewritten,
+    so a popped pair whose count changed just goes back in with the right count
+    contents should be every string that actually gets stored, once
+    '''
+    contents = list(contents)
+    counts = Counter()
+    holders = defaultdict(set) # pair -> strings it's been seen in
+    for k, content in enumerate(contents):
+        for pair in get_pairs(content):
+            counts[pair] += 1
+            holders[pair].add(k)
+
+    heap = [(-count, pair) for pair, count in counts.items()]
+    heapq.heapify(heap)
+
+    dictionary = []
+    while heap and len(dictionary) < max_entries:
+        negative_count, pair = heapq.heappop(heap)
+        count = counts[pair]
+        if count != -negative_count:
+            if count > 0:
+                heapq.heappush(heap, (-count, pair))
+            continue
+        if count <= entry_size:
+            break
+
+        code = bytes([first_code + len(dictionary)])
+        dictionary.append(pair)
+
+        changed = set()
+        for k in holders.pop(pair):
+            old_content = contents[k]
+            contents[k] = old_content.replace(pair, code)
+            for old_pair in get_pairs(old_content):
+                counts[old_pair] -= 1
+                changed.add(old_pair)
+            for new_pair in get_pairs(contents[k]):
+                counts[new_pair] += 1
+                holders[new_pair].add(k)
+                changed.add(new_pair)
+
+        for changed_pair in changed:
+            if counts[changed_pair] > 0:
+                heapq.heappush(heap, (-counts[changed_pair], changed_pair))
+
+    return dictionary
+
+
+def compress(content, dictionary):
+    '''
+    replace pairs in the order they were picked, exactly like build_dictionary did
+    '''
+    for i, pair in enumerate(dictionary):
+        content = content.replace(pair, bytes([first_code + i]))
+    return content
+
+
+def compress_bytes(en_bytes, dictionary):
+    '''
+    compress an encoded string, keeping it terminated and word aligned
+    '''
+    if not en_bytes:
+        return en_bytes
+    return terminate(compress(get_content(en_bytes), dictionary))
+
+
+def decompress(data, dictionary):
+    '''
+    the reference decoder, this is what the text routine in the game has to do:
+    read bytes up to the first 0
+    a byte from first_code to first_code + len(dictionary) - 1 is drawn as the two bytes of its entry,
+    which are always plain bytes, and both count as characters (so even/odd tiles still alternate)
+    every other byte is drawn as itself, like before
+    '''
+    output = bytearray()
+    for byte in data:
+        if byte == 0:
+            break
+        if first_code <= byte < first_code + len(dictionary):
+            output += dictionary[byte - first_code]
+        else:
+            output.append(byte)
+    return bytes(output)
+
+
+def get_dictionary_bytes(dictionary):
+    '''
+    the table the game looks codes up in: 2 bytes per code, all n_codes of them, unused ones are 0
+    '''
+    return b"".join(dictionary) + bytes(entry_size * (n_codes - len(dictionary)))
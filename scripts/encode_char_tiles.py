@@ -1,5 +1,10 @@
+from pathlib import Path
 from PIL import Image
-from decode_char_tiles import hex_to_bytes, process_tile, print_tile
+import numpy as np
+import sys
+
+from instrument import stage, count
+from decode_char_tiles import process_tile, print_tile, decode_tile_bytes
 
 image_path = "../tiles/ascii_odd.png"
 char_width = 8
@@ -7,8 +12,18 @@ tile_width = 8
 tile_height = 13
 row_height = 14 # png has 14px rows, so adjust for this
 
+# how the cells in a sheet are laid out: (cell widths, repeating across a row), encoded tile width
+# narrow cells are padded on the right to fill the tile
+tile_layouts = {
+    "half": ([8], 8), # ascii_even.png and ascii_odd.png
+    "full": ([16], 16), # fullwidth shift jis tiles, like process_tile(..., tile_width=16)
+    "alternating": ([8, 6], 8), # the game's 14px cells
+    "capital": ([7], 8), # 7px capitals
+}
+
 
 
+@stage()
 def split_into_tiles(image_path, char_width, tile_width, tile_height, row_height):
     '''
     split an image of characters into individual tiles
@@ -83,6 +98,137 @@ def encode_tile(tile, n_row_bytes=2):
     return rows
 
 
+@stage()
+def load_sheet(image_path):
+    '''
+    read a whole image of characters into an array in one go
+    black pixels (ink) are True
+    '''
+    image = Image.open(image_path).convert("L") # convert to grayscale
+    count("bytes_read", Path(image_path).stat().st_size)
+    return np.asarray(image) < 128
+
+
+def get_cell_layout(image_width, char_width):
+    '''
+    left edge and width of every cell that fits in a row
+    '''
+    if isinstance(char_width, int):
+        char_width = [char_width]
+
+    n_repeats = image_width // sum(char_width) + 1
+    cell_widths = np.tile(char_width, n_repeats)
+    cell_starts = np.concatenate([[0], np.cumsum(cell_widths)[:-1]])
+    fits = cell_starts + cell_widths <= image_width
+    return cell_starts[fits], cell_widths[fits]
+
+
+@stage()
+def split_sheet(ink, char_width, tile_height, row_height, tile_width):
+    '''
+    cut a sheet into tile cells, in the same order as split_into_tiles
+    char_width can also be a list of widths that repeats across each row
+    cells wider than the tile get cropped, narrower ones get padded
+    returns an (n_tiles, tile_height, tile_width) array
+    '''
+    image_height, image_width = ink.shape
+
+    # pad out a partial last row so everything reshapes nicely
+    n_rows = -(-image_height // row_height)
+    ink = np.pad(ink, ((0, n_rows * row_height - image_height), (0, 0)))
+    ink = ink.reshape(n_rows, row_height, image_width)[:, :tile_height]
+
+    cell_starts, cell_widths = get_cell_layout(image_width, char_width)
+
+    # gather every cell's columns at once, blanking anything past the cell's own width
+    offsets = np.arange(tile_width)
+    columns = np.minimum(cell_starts[:, np.newaxis] + offsets, image_width - 1)
+    inside = offsets < cell_widths[:, np.newaxis]
+    cells = ink[:, :, columns] & inside
+
+    n_columns = len(cell_starts)
+    cells = cells.transpose(0, 2, 1, 3)
+    return cells.reshape(n_rows * n_columns, tile_height, tile_width)
+
+
+@stage()
+def encode_cells(cells):
+    '''
+    encode an (n_tiles, tile_height, tile_width) array of cells
+    each pixel pair is 2 bits with the left pixel high, so a row byte is just 8 pixels as bits
+    '''
+    n_tiles = cells.shape[0]
+    return np.packbits(cells, axis=-1).reshape(n_tiles, -1)
+
+
+def encode_sheet(ink, char_width, tile_height, row_height, n_row_bytes=2):
+    '''
+    encode every tile in a sheet at once
+    returns an (n_tiles, tile_height * n_row_bytes) array of bytes
+    '''
+    cells = split_sheet(ink, char_width, tile_height, row_height, 8 * n_row_bytes)
+    return encode_cells(cells)
+
+
+def encode_tilesets(image_paths, char_width, tile_height, row_height, n_row_bytes=2):
+    '''
+    encode several tilesets and interleave them tile by tile
+    (tile 0 of every set, then tile 1 of every set, ...)
+    '''
+    tilesets = [encode_sheet(load_sheet(path), char_width, tile_height, row_height, n_row_bytes)
+                for path in image_paths]
+    return np.stack(tilesets, axis=1).tobytes()
+
+
+def encode_layout(ink, layout):
+    '''
+    encode a sheet using one of the named tile layouts
+    returns the cells and their encoded tiles
+    '''
+    cell_widths, tile_width = tile_layouts[layout]
+    cells = split_sheet(ink, cell_widths, tile_height, row_height, tile_width)
+    return cells, encode_cells(cells)
+
+
+def verify_sheet(image_path, layout):
+    '''
+    encode every tile in a sheet, decode them all back at once (decode_tile_bytes),
+    and compare each one with its spot in the original sheet, not the cropped cell the encoder saw
+    so a cell that's too narrow, cropped, or in the wrong place shows up as mismatched pixels
+    returns the number of mismatched pixels in each tile, and the ink in the sheet that isn't in any cell
+    '''
+    ink = load_sheet(image_path)
+    image_height, image_width = ink.shape
+    cell_widths, tile_width = tile_layouts[layout]
+    cell_starts, cell_widths = get_cell_layout(image_width, cell_widths)
+    n_columns = len(cell_starts)
+
+    cells, encoded = encode_layout(ink, layout)
+    pixels = decode_tile_bytes(encoded, tile_width // 8, tile_height=tile_height) != 0
+
+    # every tile's spot in the sheet, wide enough for the tile or the cell, whichever is wider
+    # (zero padding past the edges, so a cell cut off by the edge of the sheet still gets compared in full)
+    window_width = max(tile_width, int(cell_widths.max()))
+    padded = np.pad(ink, ((0, tile_height), (0, window_width)))
+    tiles = np.arange(len(encoded))
+    tops = (tiles // n_columns) * row_height
+    lefts = cell_starts[tiles % n_columns]
+    in_cell = np.arange(window_width) < cell_widths[tiles % n_columns][:, None, None]
+    rows = tops[:, None, None] + np.arange(tile_height)[None, :, None]
+    columns = lefts[:, None, None] + np.arange(window_width)[None, None, :]
+    original = padded[rows, columns] & in_cell
+
+    # the tile has to match the cell, be blank past it, and nothing in the cell can get cut off
+    pixels = np.pad(pixels, ((0, 0), (0, 0), (0, window_width - tile_width)))
+    mismatches = (pixels != original).sum(axis=(1, 2))
+
+    covered = np.zeros_like(padded)
+    in_cell = np.broadcast_to(in_cell, original.shape)
+    covered[np.broadcast_to(rows, original.shape)[in_cell], np.broadcast_to(columns, original.shape)[in_cell]] = True
+
+    return mismatches, int((ink & ~covered[:image_height, :image_width]).sum())
+
+
 def decode_hex_string(hex_string, n_row_bytes=2):
     '''
     read in a string of tile bytes and decode them
@@ -125,13 +271,22 @@ def tile_to_hex(tile, n_row_bytes=2):
 
 
 if __name__ == "__main__":
+    '''
+    round trip every tile in a sheet and print the ones that don't survive
+    '''
+    if len(sys.argv) > 1:
+        image_path = sys.argv[1]
+    layout = sys.argv[2] if len(sys.argv) > 2 else "half"
 
-    tiles = split_into_tiles(image_path, char_width, tile_width, tile_height)
+    mismatches, n_lost = verify_sheet(image_path, layout)
+    bad_tiles = np.flatnonzero(mismatches)
+    print(len(mismatches), "tiles checked,", len(bad_tiles), "with mismatched pixels,", n_lost, "inked pixels outside every cell")
 
-    for tile in tiles:
-        print_png_tile(tile)
-        print("")
-        tile_hex = tile_to_hex(tile, 1)
-        decoded = decode_hex_string(tile_hex, 1)
-        print_tile(process_tile(decoded, 8))
+    # show what the bad ones look like after the round trip
+    cells, encoded = encode_layout(load_sheet(image_path), layout)
+    tile_width = tile_layouts[layout][1]
+    for i in bad_tiles:
+        print("tile", i, ":", mismatches[i], "pixels")
+        decoded = decode_hex_string(encoded[i].tobytes().hex(), tile_width // 8)
+        print_tile(process_tile(decoded, tile_width))
         print("")
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageDraw
+import numpy as np
+import csv
+
+from rom_image import RomImage
+from decode_char_tiles import rom_path, tile_tables, get_shift_jis_tables, decode_tile_range
+
+rom_file = Path(__file__).resolve().parent / rom_path
+output_path = "font_atlas"
+index_file_name = "font_atlas_index.csv"
+
+# the english table is 8px tiles, one even and one odd per ascii code
+# see create_ascii_binary
+n_english_tiles = 128
+
+# sheet layout
+columns = 16
+scale = 2
+label_height = 12
+cell_width = 16 * scale + 8
+cell_height = 13 * scale + label_height + 2
+
+
+def get_sheet_jobs(tables):
+    '''
+    split every valid tile into sheets, one per table chunk (first byte of the shift jis code)
+    '''
+    jobs = []
+    for table_name in tile_tables:
+        inverse = tables[table_name]
+        tile_indices = np.flatnonzero(inverse >= 0)
+        if table_name == "english":
+            tile_indices = tile_indices[tile_indices < n_english_tiles]
+
+        codes = inverse[tile_indices]
+        for byte1 in np.unique(codes >> 8):
+            mask = (codes >> 8) == byte1
+            sheet_name = table_name + "_" + format(int(byte1), "02x")
+            jobs.append((table_name, sheet_name, codes[mask].tolist(), tile_indices[mask].tolist()))
+
+    return jobs
+
+
+def decode_tiles(rom, table_name, tile_indices):
+    '''
+    decode just the span of the table that the sheet needs
+    english tiles come in even/odd pairs, so glue them together into one 16px tile
+    '''
+    first = min(tile_indices)
+    n_tiles = max(tile_indices) - first + 1
+    base = tile_tables[table_name]
+
+    if table_name == "english":
+        tiles = decode_tile_range(rom, base, 2 * first, 2 * n_tiles, n_row_bytes=1)
+        tiles = tiles.reshape(n_tiles, 2, 13, 8).transpose(0, 2, 1, 3).reshape(n_tiles, 13, 16)
+    else:
+        tiles = decode_tile_range(rom, base, first, n_tiles)
+
+    return tiles[np.array(tile_indices) - first]
+
+
+def render_sheet(job):
+    '''
+    draw one labelled sheet and return its rows for the index
+    runs in a worker process, so it opens its own copy of the rom
+    '''
+    rom_file, output_path, table_name, sheet_name, codes, tile_indices = job
+
+    with RomImage(rom_file) as rom:
+        tiles = decode_tiles(rom, table_name, tile_indices)
+
+    # ink is black like in the tile pngs
+    pixels = np.where(tiles != 0, 0, 255).astype(np.uint8)
+    pixels = pixels.repeat(scale, axis=1).repeat(scale, axis=2)
+
+    n_rows = (len(codes) + columns - 1) // columns
+    sheet = Image.new("L", (columns * cell_width, n_rows * cell_height), 255)
+    draw = ImageDraw.Draw(sheet)
+
+    rows = []
+    for i, (code, tile_index) in enumerate(zip(codes, tile_indices)):
+        x = (i % columns) * cell_width
+        y = (i // columns) * cell_height
+        draw.text((x + 2, y), format(code, "04x"), fill=128)
+        sheet.paste(Image.fromarray(pixels[i]), (x + 4, y + label_height))
+
+        # every slot is 26 bytes, even the english ones (2 8px tiles)
+        file_offset = tile_tables[table_name] + 26 * tile_index
+        rows.append([format(code, "04x"), tile_index, format(file_offset, "x"), table_name, sheet_name])
+
+    sheet.save(Path(output_path) / (sheet_name + ".png"))
+    return rows
+
+
+def export_font_atlas(rom_file=rom_file, output_path=output_path):
+    '''
+    render every tile in every table, spread over all cores
+    '''
+    # only this process needs the lookup tables, the workers just get codes and tile indices
+    with RomImage(rom_file) as rom:
+        jobs = [(rom_file, output_path) + job for job in get_sheet_jobs(get_shift_jis_tables(rom))]
+
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(render_sheet, jobs))
+
+    index_path = Path(output_path) / index_file_name
+    with open(index_path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["sjis_code", "glyph_index", "file_offset", "table", "sheet"])
+        for rows in results:
+            writer.writerows(rows)
+
+    print("Created", len(jobs), "sheets in", output_path)
+    print("Created", index_path)
+
+
+
+
+if __name__ == "__main__":
+
+    export_font_atlas()
@@ -0,0 +1,152 @@
+from pathlib import Path
+import numpy as np
+import csv
+import sys
+
+from rom_image import RomImage, exe_header_size
+from decode_char_tiles import rom_path
+
+# a run of pointers has to be at least this long to count as a table
+min_run_length = 4
+
+# japanese strings in the exe are padded out to words, so their addresses are too
+target_alignment = 4
+
+# anything longer than this probably isn't a string
+max_string_length = 256
+
+# the pointer tables ghidra extracts: name <tab> start <tab> end (ram addresses in hex, end not included)
+pointer_tables_path = Path(__file__).resolve().parent.parent / "ghidra" / "pointer_tables.tsv"
+
+
+def read_pointer_tables(path=pointer_tables_path):
+    '''
+    (name, start address, end address) for every pointer table in the ghidra manifest, if there is one
+    '''
+    if not Path(path).exists():
+        return []
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        return [(row["name"], int(row["start"], 16), int(row["end"], 16)) for row in reader]
+
+
+def get_words(rom):
+    '''
+    the code and data after the header as little endian words
+    '''
+    n_words = (len(rom) - exe_header_size) // 4
+    return np.frombuffer(rom.slice(exe_header_size, 4 * n_words), dtype="<u4")
+
+
+def get_string(rom, address):
+    '''
+    raw bytes of the null terminated string at a ram address, or None if there's no terminator close by
+    '''
+    data = bytes(rom.slice_at_ram(address, max_string_length + 1))
+    end = data.find(b"\x00")
+    if end == -1:
+        return None
+    return data[:end]
+
+
+def is_shift_jis_text(raw_bytes):
+    '''
+    non-empty, decodes as shift jis, and has no control characters
+    (fullwidth spaces are fine, lots of menu text is padded with them)
+    '''
+    if not raw_bytes:
+        return False
+    try:
+        text = raw_bytes.decode("shift_jis")
+    except UnicodeDecodeError:
+        return False
+    return text.replace("\u3000", " ").isprintable()
+
+
+def get_valid_targets(rom, words):
+    '''
+    check every distinct word that could point into the exe, once
+    returns a boolean array: does this word point at shift jis text
+    and the set of targets that have any double byte characters in them
+    '''
+    start = rom.load_address
+    end = rom.load_address + len(rom) - exe_header_size
+    candidates = (words >= start) & (words < end) & (words % target_alignment == 0)
+
+    valid_targets = set()
+    japanese_targets = set()
+    for target in np.unique(words[candidates]).tolist():
+        raw_bytes = get_string(rom, target)
+        if raw_bytes is not None and is_shift_jis_text(raw_bytes):
+            valid_targets.add(target)
+            if any(byte >= 0x80 for byte in raw_bytes):
+                japanese_targets.add(target)
+
+    valid = candidates & np.isin(words, np.fromiter(valid_targets, dtype=np.uint32, count=len(valid_targets)))
+    return valid, japanese_targets
+
+
+def find_runs(valid):
+    '''
+    (first word, number of words) for every run of consecutive True words
+    '''
+    edges = np.diff(np.concatenate([[0], valid.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+
+def find_pointer_tables(rom):
+    '''
+    find runs of words pointing at shift jis text, best looking first
+    each candidate is (pointer table ram address, number of pointers, fraction of strings with japanese in them)
+    '''
+    words = get_words(rom)
+    valid, japanese_targets = get_valid_targets(rom, words)
+
+    candidates = []
+    for first, length in find_runs(valid):
+        if length < min_run_length:
+            continue
+        targets = words[first:first + length].tolist()
+        japanese_fraction = sum(target in japanese_targets for target in targets) / length
+        address = rom.offset_to_ram(exe_header_size + 4 * first)
+        candidates.append((address, length, japanese_fraction))
+
+    candidates.sort(key=lambda candidate: (-candidate[1] * candidate[2], -candidate[1]))
+    return candidates
+
+
+def write_candidate_csv(rom, address, length, output_path):
+    '''
+    save a candidate table in the same format as the ghidra extraction
+    '''
+    file_name = Path(output_path) / (format(address, "08x") + "_ptr_table_strings.csv")
+    with open(file_name, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["jp_pointer", "jp_address", "jp_string"])
+        for i in range(length):
+            pointer = address + 4 * i
+            target = rom.read_int_at_ram(pointer, 4)
+            writer.writerow([format(pointer, "08x"), format(target, "08x"), get_string(rom, target).hex()])
+    return file_name
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python find_pointer_tables.py [output dir] [number of tables to save]
+    '''
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("pointer_tables")
+    n_saved = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with RomImage(Path(__file__).resolve().parent / rom_path) as rom:
+        candidates = find_pointer_tables(rom)
+        print(len(candidates), "candidate pointer tables")
+
+        output_path.mkdir(parents=True, exist_ok=True)
+        for address, length, japanese_fraction in candidates[:n_saved]:
+            file_name = write_candidate_csv(rom, address, length, output_path)
+            print(hex(address), length, "pointers,", format(japanese_fraction, ".0%"), "japanese ->", file_name)
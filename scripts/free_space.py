@@ -0,0 +1,242 @@
+from pathlib import Path
+import numpy as np
+import bisect
+import csv
+
+from string_table import get_block_dictionary
+from allocate_strings import align, alignment
+from find_pointer_tables import read_pointer_tables
+
+# extra places in the exe we know we can put strings, one region per line:
+# start_address <tab> end_address <tab> note (ram addresses in hex, like the translation csvs)
+spare_regions_path = Path(__file__).resolve().parent.parent / "spare_regions.csv"
+
+# en_block for strings that got moved out of the overflow block into free space
+relocated_block = -2
+
+
+class FreeSpace:
+    '''
+    sorted, non-overlapping list of free [start, end) intervals
+    plus the same intervals as (length, start), sorted by size, for allocate
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.sizes = []
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        '''
+        mark a region as free, merging it with any free regions it touches
+        '''
+        if end <= start:
+            return
+
+        # first interval that ends at or after our start, and first one that starts after our end
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+
+        self.replace(i, j, [(start, end)])
+
+    def remove(self, start, end):
+        '''
+        mark a region as used, splitting any free region it lands in
+        '''
+        i = bisect.bisect_right(self.ends, start)
+        j = bisect.bisect_left(self.starts, end)
+        pieces = []
+        for free_start, free_end in zip(self.starts[i:j], self.ends[i:j]):
+            if free_start < start:
+                pieces.append((free_start, start))
+            if end < free_end:
+                pieces.append((end, free_end))
+
+        self.replace(i, j, pieces)
+
+    def replace(self, i, j, regions):
+        '''
+        swap free regions i to j for new ones, keeping the size index in step
+        '''
+        for start, end in zip(self.starts[i:j], self.ends[i:j]):
+            del self.sizes[bisect.bisect_left(self.sizes, (end - start, start))]
+        for start, end in regions:
+            bisect.insort(self.sizes, (end - start, start))
+
+        self.starts[i:j] = [region[0] for region in regions]
+        self.ends[i:j] = [region[1] for region in regions]
+
+    def allocate(self, size):
+        '''
+        take an aligned spot for size bytes from the smallest free region it fits in
+        (ties go to the lowest address)
+        returns the address, or None if nothing is big enough
+        '''
+        # aligning the start loses less than a word, so past the first region that fits
+        # only regions less than a word bigger can still have less room
+        best = None # (room, address)
+        for k in range(bisect.bisect_left(self.sizes, (size, -1)), len(self.sizes)):
+            length, start = self.sizes[k]
+            if best is not None and length - (alignment - 1) > best[0]:
+                break
+            address = align(start)
+            room = start + length - address
+            if size <= room and (best is None or (room, address) < best):
+                best = (room, address)
+
+        if best is None:
+            return None
+        address = best[1]
+        self.remove(address, address + size)
+        return address
+
+    def free(self, address, size):
+        self.add(address, address + size)
+
+    def contains(self, start, end):
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i >= 0 and end <= self.ends[i]
+
+    def get_total(self):
+        return sum(end - start for start, end in self)
+
+    def get_largest(self):
+        return max((end - start for start, end in self), default=0)
+
+
+def read_spare_regions(path=spare_regions_path):
+    '''
+    user-declared spare regions, if there are any
+    '''
+    if not Path(path).exists():
+        return []
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        return [(int(row["start_address"], 16), int(row["end_address"], 16)) for row in reader]
+
+
+def get_block_regions(tables):
+    '''
+    every japanese string block of every table
+    '''
+    regions = []
+    for table in tables.values():
+        regions += list(get_block_dictionary(table).values())[:-1]
+    return regions
+
+
+def get_pointer_table_regions(tables):
+    '''
+    every pointer table in the ghidra manifest, plus every pointer in the tables themselves
+    '''
+    regions = [(start, end) for name, start, end in read_pointer_tables()]
+    for table in tables.values():
+        regions += [(pointer, pointer + 4) for pointer in table.integers["jp_pointer"].tolist()]
+    return regions
+
+
+def get_kept_regions(tables):
+    '''
+    every untranslated japanese string that has to stay where it is (see string_pool.keep_untranslated_strings)
+    '''
+    regions = []
+    for table in tables.values():
+        if "kept_length" in table.integers:
+            kept = np.flatnonzero(table.integers["kept_length"])
+            addresses = table.integers["jp_address"][kept].tolist()
+            regions += [(address, address + length) for address, length in zip(addresses, table.integers["kept_length"][kept].tolist())]
+    return regions
+
+
+def build_free_space(tables, spare_regions=(), evict=False):
+    '''
+    the japanese blocks plus any spare regions, minus the pointer tables, the untranslated strings,
+    and the english strings already placed in them
+    tables can share japanese blocks, so with evict, a string that lands on one from an earlier table
+    gets bumped back to the overflow block instead
+    '''
+    free_space = FreeSpace()
+    for start, end in get_block_regions(tables) + list(spare_regions):
+        free_space.add(start, end)
+    for start, end in get_pointer_table_regions(tables) + get_kept_regions(tables):
+        free_space.remove(start, end)
+
+    for table in tables.values():
+        overflow_block = list(get_block_dictionary(table))[-1]
+        en_blocks = table.integers["en_block"]
+        placed = (table.integers["en_length"] != 0) & (en_blocks >= 0) & (en_blocks != overflow_block)
+        for i in np.flatnonzero(placed).tolist():
+            start = int(table.integers["en_address"][i])
+            end = start + align(int(table.integers["en_length"][i]))
+            if evict and not free_space.contains(start, end):
+                en_blocks[i] = overflow_block
+                continue
+            free_space.remove(start, end)
+
+    return free_space
+
+
+def relocate_overflow(tables, spare_regions=()):
+    '''
+    move every string stuck in the overflow block into real free space, biggest first
+    the pointer tables follow automatically since they're written from en_address
+    returns the free space that's left, what moved, and what still doesn't fit
+    '''
+    free_space = build_free_space(tables, spare_regions, evict=True)
+
+    overflowing = []
+    for table_name, table in tables.items():
+        overflow_block = list(get_block_dictionary(table))[-1]
+        en_lengths = table.integers["en_length"]
+        rows = np.flatnonzero((table.integers["en_block"] == overflow_block) & (en_lengths != 0)).tolist()
+        overflowing += [(table_name, i, int(en_lengths[i])) for i in rows]
+    overflowing.sort(key=lambda string: -string[2])
+
+    relocated = []
+    stuck = []
+    for table_name, i, length in overflowing:
+        address = free_space.allocate(align(length))
+        if address is None:
+            stuck.append((table_name, i))
+            continue
+
+        table = tables[table_name]
+        table.integers["en_block"][i] = relocated_block
+        table.integers["en_address"][i] = address
+        relocated.append((table_name, i, address))
+
+        # repeats of this string in the same table move with it
+        repeats = (table.integers["jp_address"] == table.integers["jp_address"][i]) & (table.integers["en_length"] == 0)
+        table.integers["en_block"][repeats] = relocated_block
+        table.integers["en_address"][repeats] = address
+
+    return free_space, relocated, stuck
+
+
+def print_layout_report(tables, free_space, relocated, stuck):
+    total = free_space.get_total()
+    largest = free_space.get_largest()
+    fragmentation = 1 - largest / total if total else 0
+
+    print("relocated", len(relocated), "strings into free space")
+    for table_name, i, address in relocated:
+        print("   ", table_name, repr(tables[table_name][i].en_text), "->", hex(address))
+
+    print(len(stuck), "strings still don't fit")
+    for table_name, i in stuck:
+        print("   ", table_name, repr(tables[table_name][i].en_text), tables[table_name][i].en_length, "bytes")
+
+    print("free:", total, "bytes in", len(free_space), "regions, largest", largest,
+          "bytes, fragmentation", format(fragmentation, ".0%"))
+    for start, end in free_space:
+        print("   ", hex(start), "-", hex(end), end - start, "bytes")
@@ -0,0 +1,243 @@
+from pathlib import Path
+import numpy as np
+import csv
+import sys
+
+from rom_image import RomImage
+from decode_char_tiles import rom_path, tile_table_kanji, tile_table_english, get_shift_jis_tables
+from find_pointer_tables import find_pointer_tables, get_string, find_runs, read_pointer_tables
+from string_table import StringTable, add_ascii_bytes, add_byte_lengths, add_japanese_block_indices, get_block_dictionary
+from string_pool import translations_path
+from free_space import spare_regions_path, read_spare_regions
+from allocate_strings import align
+
+# every kanji slot is 13 rows of 2 bytes
+tile_size = 26
+
+# ranges shorter than this aren't worth the trouble
+min_range_tiles = 4
+
+spare_region_note = "unused kanji tiles"
+
+
+def get_string_codes(raw_bytes):
+    '''
+    the shift jis codes in a string, in the same form as decode_char_tiles
+    single bytes (ascii, and the capital-after-space bytes) come out as byte << 8, like the game reads them
+    '''
+    codes = []
+    i = 0
+    while i < len(raw_bytes):
+        byte1 = raw_bytes[i]
+        if (0x81 <= byte1 < 0xa0 or 0xe0 <= byte1 < 0xfd) and i + 1 < len(raw_bytes):
+            codes.append((byte1 << 8) | raw_bytes[i + 1])
+            i += 2
+        else:
+            codes.append(byte1 << 8)
+            i += 1
+    return codes
+
+
+def get_table_strings(input_files):
+    '''
+    what every row of the translation tables draws now: the english string if it has one, the japanese one if not
+    returns the strings, every pointer the tables cover,
+    and the [start, end) ram addresses of their pointer tables and japanese string blocks
+    '''
+    strings = []
+    pointers = set()
+    regions = []
+    for input_file in input_files:
+        table = add_ascii_bytes(StringTable.read(input_file))
+        pointers.update(table.integers["jp_pointer"][table.integers["is_pointer"] != 0].tolist())
+        for i in range(len(table)):
+            if table.lengths["en_bytes"][i]:
+                strings.append(table.get_bytes("en_bytes", i))
+            else:
+                strings.append(table.get_bytes("jp_string", i))
+
+        regions.append((int(table.integers["jp_pointer"].min()), int(table.integers["jp_pointer"].max()) + 4))
+        table = add_japanese_block_indices(add_byte_lengths(table))
+        regions += list(get_block_dictionary(table).values())[:-1]
+    return strings, pointers, regions
+
+
+def get_scanned_strings(rom, known_pointers):
+    '''
+    strings behind every other pointer table the scanner finds in the exe
+    nothing in those is translated yet, so their glyphs have to stay
+    (the scanner's false positives only make the census more careful)
+    returns the strings, and the ram addresses of the tables and strings
+    '''
+    strings = []
+    regions = []
+    for address, length, japanese_fraction in find_pointer_tables(rom):
+        regions.append((address, address + 4 * length))
+        for pointer in range(address, address + 4 * length, 4):
+            if pointer in known_pointers:
+                continue
+            target = rom.read_int_at_ram(pointer, 4)
+            raw_bytes = get_string(rom, target)
+            if raw_bytes:
+                strings.append(raw_bytes)
+                regions.append((target, target + len(raw_bytes) + 1))
+    return strings, regions
+
+
+def count_codes(strings):
+    '''
+    how many times every shift jis code gets drawn
+    '''
+    counts = np.zeros(0x10000, dtype=np.int64)
+    for raw_bytes in strings:
+        np.add.at(counts, get_string_codes(raw_bytes), 1)
+    return counts
+
+
+def get_kanji_table_end(rom, known_regions):
+    '''
+    ram address where the kanji slots really stop: the first known table or string after they start
+    (the shift jis table happily maps codes past that, into whatever comes next)
+    '''
+    start = rom.offset_to_ram(tile_table_kanji)
+    ends = [region_start for region_start, region_end in known_regions if region_start >= start]
+    return min(ends + [rom.offset_to_ram(tile_table_english)])
+
+
+def get_unused_kanji_tiles(rom, counts, known_regions=()):
+    '''
+    True for every kanji slot that no code in use points at
+    slots that no code points at at all can't be drawn either, so they count as unused
+    slots past the real end of the table, or on top of anything in known_regions, are never unused
+    '''
+    tables = get_shift_jis_tables(rom)
+    code_to_tile = tables["code_to_tile"]
+    start = rom.offset_to_ram(tile_table_kanji)
+    n_tiles = min(len(tables["kanji"]), (get_kanji_table_end(rom, known_regions) - start) // tile_size)
+
+    kanji_codes = np.arange(0x8800, 0x10000)
+    used_codes = kanji_codes[(counts[0x8800:] > 0) & (code_to_tile[0x8800:] >= 0)]
+    used_tiles = code_to_tile[used_codes]
+    unused = np.ones(n_tiles, dtype=bool)
+    unused[used_tiles[used_tiles < n_tiles]] = False
+
+    for region_start, region_end in known_regions:
+        first = max((region_start - start) // tile_size, 0)
+        last = -(-(region_end - start) // tile_size)
+        if last > 0:
+            unused[first:last] = False
+    return unused
+
+
+def get_reclaimable_ranges(unused, min_tiles=min_range_tiles):
+    '''
+    (first tile, number of tiles) for every run of unused slots, biggest first
+    '''
+    ranges = [(first, n_tiles) for first, n_tiles in find_runs(unused) if n_tiles >= min_tiles]
+    ranges.sort(key=lambda tile_range: (-tile_range[1], tile_range[0]))
+    return ranges
+
+
+def get_range_addresses(rom, first, n_tiles):
+    '''
+    ram addresses of a range of kanji slots, as [start, end)
+    '''
+    start = rom.offset_to_ram(tile_table_kanji + tile_size * first)
+    return start, start + tile_size * n_tiles
+
+
+def take_tiles(rom, ranges, n_wanted):
+    '''
+    hand out slots for new tiles, from the smallest ranges up so the big ones stay whole for strings
+    each is (tile index, the shift jis code that draws it, rom offset)
+    '''
+    inverse = get_shift_jis_tables(rom)["kanji"]
+    slots = []
+    for first, n_tiles in sorted(ranges, key=lambda tile_range: tile_range[1]):
+        for tile_index in range(first, first + n_tiles):
+            code = int(inverse[tile_index])
+            if code < 0:
+                # nothing can draw this slot, so a new tile there would be useless
+                continue
+            slots.append((tile_index, code, tile_table_kanji + tile_size * tile_index))
+            if len(slots) == n_wanted:
+                return slots
+    return slots
+
+
+def add_spare_regions(rom, ranges, path=spare_regions_path):
+    '''
+    give ranges to the string relocation (free_space) by adding them to the spare regions file
+    returns how many were new
+    '''
+    spare_regions = set(read_spare_regions(path))
+    new_regions = []
+    for first, n_tiles in ranges:
+        start, end = get_range_addresses(rom, first, n_tiles)
+        start = align(start)
+        if end > start and (start, end) not in spare_regions:
+            new_regions.append((start, end))
+
+    new_file = not Path(path).exists()
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        if new_file:
+            writer.writerow(["start_address", "end_address", "note"])
+        for start, end in new_regions:
+            writer.writerow([format(start, "08x"), format(end, "08x"), spare_region_note])
+    return len(new_regions)
+
+
+def take_census(rom, input_files, scan=True):
+    '''
+    count the codes every known pointer table still draws
+    returns the counts, and the unused kanji slots (never overlapping a pointer table or string we know of)
+    '''
+    strings, known_pointers, known_regions = get_table_strings(input_files)
+    known_regions += [(start, end) for name, start, end in read_pointer_tables()]
+    if scan:
+        scanned_strings, scanned_regions = get_scanned_strings(rom, known_pointers)
+        strings += scanned_strings
+        known_regions += scanned_regions
+    counts = count_codes(strings)
+    return counts, get_unused_kanji_tiles(rom, counts, known_regions)
+
+
+def print_census(rom, counts, unused, ranges, min_tiles=min_range_tiles):
+    n_codes = np.count_nonzero(counts)
+    n_kanji = np.count_nonzero(counts[0x8800:])
+    print(n_codes, "distinct codes still drawn,", n_kanji, "of them kanji")
+    print(np.count_nonzero(unused), "of", len(unused), "kanji slots unused,",
+          tile_size * int(np.count_nonzero(unused)), "bytes")
+
+    total = sum(n_tiles for first, n_tiles in ranges)
+    print(len(ranges), "ranges of at least", min_tiles, "slots,", total, "slots,", tile_size * total, "bytes")
+    for first, n_tiles in ranges:
+        start, end = get_range_addresses(rom, first, n_tiles)
+        print("   ", "slots", first, "-", first + n_tiles - 1, "(" + str(n_tiles) + ")",
+              hex(start), "-", hex(end), tile_size * n_tiles, "bytes")
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python glyph_census.py [--no-scan] [--spare] [--tiles n]
+    --spare adds the ranges to spare_regions.csv for string relocation
+    --tiles lists n free slots for new tiles, with the code that draws each
+    '''
+    args = sys.argv[1:]
+    input_files = sorted(translations_path.glob("*.csv"))
+
+    with RomImage(Path(__file__).resolve().parent / rom_path) as rom:
+        counts, unused = take_census(rom, input_files, scan="--no-scan" not in args)
+        ranges = get_reclaimable_ranges(unused)
+        print_census(rom, counts, unused, ranges)
+
+        if "--tiles" in args:
+            n_wanted = int(args[args.index("--tiles") + 1])
+            for tile_index, code, offset in take_tiles(rom, ranges, n_wanted):
+                print("   ", "slot", tile_index, "code", format(code, "04x"), "at", hex(offset))
+
+        if "--spare" in args:
+            print("Added", add_spare_regions(rom, ranges), "regions to", spare_regions_path)
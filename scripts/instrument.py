@@ -0,0 +1,126 @@
+from pathlib import Path
+import functools
+import atexit
+import json
+import time
+import os
+
+# set this to a file name prefix to turn profiling on, like
+#   PROFILE_BUILD=profile python create_translation_binary.py ../translations/item_ptr_table_strings.csv
+# which writes profile.json (per stage totals) and profile.folded (for flamegraph.pl or speedscope)
+profile_variable = "PROFILE_BUILD"
+profile_prefix = os.environ.get(profile_variable, "")
+
+# decided once at import, so when it's off the decorators hand back the original functions untouched
+enabled = profile_prefix != ""
+
+# name -> {"calls", "seconds", "counters"}
+stages = {}
+
+# folded stack ("outer;inner") -> microseconds spent in the innermost stage itself
+folded = {}
+
+# [stage name, seconds spent in child stages] for every stage that's running
+stack = []
+
+start_time = time.perf_counter()
+
+
+def get_stage(name):
+    if name not in stages:
+        stages[name] = {"calls": 0, "seconds": 0.0, "counters": {}}
+    return stages[name]
+
+
+def stage(name=None):
+    '''
+    decorator: time every call to a function as one stage of the build
+    '''
+    def decorator(function):
+        if not enabled:
+            return function
+
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack.append([stage_name, 0.0])
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _, child_seconds = stack.pop()
+
+                stats = get_stage(stage_name)
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+
+                path = ";".join([frame[0] for frame in stack] + [stage_name])
+                folded[path] = folded.get(path, 0) + 1e6 * (elapsed - child_seconds)
+                if stack:
+                    stack[-1][1] += elapsed
+
+        return wrapper
+    return decorator
+
+
+def count(counter, amount=1):
+    '''
+    add to a counter (bytes read, bytes written, ...) of whatever stage is running
+    '''
+    if not enabled:
+        return
+
+    stage_name = stack[-1][0] if stack else "(outside any stage)"
+    counters = get_stage(stage_name)["counters"]
+    counters[counter] = counters.get(counter, 0) + amount
+
+
+def rom_read(function):
+    '''
+    decorator for RomImage reads that take (position, n_bytes): each call is one seek into the rom
+    '''
+    if not enabled:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(self, position, n_bytes):
+        count("rom_seeks")
+        count("rom_bytes_read", n_bytes)
+        return function(self, position, n_bytes)
+
+    return wrapper
+
+
+def get_report():
+    totals = {}
+    for stats in stages.values():
+        for counter, amount in stats["counters"].items():
+            totals[counter] = totals.get(counter, 0) + amount
+
+    return {
+        "wall_seconds": time.perf_counter() - start_time,
+        "totals": totals,
+        "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["seconds"])),
+    }
+
+
+def write_report(prefix=None):
+    '''
+    the json report and the folded stacks, one "outer;inner microseconds" line per stack
+    '''
+    prefix = prefix or profile_prefix
+    json_path = Path(prefix + ".json")
+    folded_path = Path(prefix + ".folded")
+
+    json_path.write_text(json.dumps(get_report(), indent=4))
+    with open(folded_path, "w") as f:
+        for path, microseconds in sorted(folded.items()):
+            f.write(path + " " + str(round(microseconds)) + "\n")
+
+    print("Profile written to", json_path, "and", folded_path)
+
+
+if enabled:
+    atexit.register(write_report)
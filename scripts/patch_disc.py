@@ -0,0 +1,20 @@
+from pathlib import Path
+import sys
+
+from disc_image import get_bin_path, patch_file
+
+exe_name = "SLPS_004.76"
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python patch_disc.py <disc .bin or .cue> <new exe> [file on disc]
+    '''
+    bin_path = get_bin_path(sys.argv[1])
+    new_data = Path(sys.argv[2]).read_bytes()
+    file_path = sys.argv[3] if len(sys.argv) > 3 else exe_name
+
+    changed = patch_file(bin_path, file_path, new_data)
+    print("Rewrote", len(changed), "sectors of", file_path, "in", bin_path)
@@ -0,0 +1,142 @@
+from pathlib import Path
+import numpy as np
+import struct
+import sys
+
+from rom_image import RomImage
+from decode_char_tiles import rom_path
+from string_table import get_block_dictionary
+from allocate_strings import check_placed
+from string_pool import translations_path, prepare_pooled_tables
+from free_space import FreeSpace, relocated_block, read_spare_regions, get_kept_regions, build_free_space, print_layout_report
+
+
+def get_string_writes(table, table_name, free_regions=None):
+    '''
+    list the block regions to clear and the strings to write for one table
+    everything is still in ram addresses here
+    relocated strings have to land in one of the free regions they were allocated from
+    '''
+    block_dictionary = get_block_dictionary(table)
+    blocks = list(block_dictionary.items())[:-1]
+    check_placed(table_name, table.get_strings("en_text"), table.integers["en_block"], table.integers["en_length"], block_dictionary)
+    en_blocks = table.integers["en_block"]
+    stored = table.integers["en_length"] != 0
+
+    clears = [(table_name, block, start_address, end_address) for block, (start_address, end_address) in blocks]
+
+    writes = []
+    for block, (start_address, end_address) in blocks:
+        for i in np.flatnonzero(stored & (en_blocks == block)).tolist():
+            address = int(table.integers["en_address"][i])
+            en_bytes = table.get_bytes("en_bytes", i)
+            # bounds check: strings have to stay inside the block they replace
+            if address < start_address or address + len(en_bytes) > end_address:
+                raise ValueError(table_name + ": " + repr(en_bytes) + " at " + hex(address)
+                                 + " runs outside of block " + hex(start_address) + "-" + hex(end_address))
+            writes.append((table_name, address, en_bytes))
+
+    for i in np.flatnonzero(stored & (en_blocks == relocated_block)).tolist():
+        address = int(table.integers["en_address"][i])
+        en_bytes = table.get_bytes("en_bytes", i)
+        if free_regions is None or not free_regions.contains(address, address + len(en_bytes)):
+            raise ValueError(table_name + ": relocated " + repr(en_bytes) + " at " + hex(address) + " isn't in free space")
+        writes.append((table_name, address, en_bytes))
+
+    return clears, writes
+
+
+def check_overlaps(writes, kept_regions=()):
+    '''
+    make sure no two strings land on top of each other (tables can share japanese blocks),
+    or on an untranslated japanese string that's staying put
+    '''
+    writes = sorted(writes, key=lambda write: write[1])
+    for (table1, address1, bytes1), (table2, address2, bytes2) in zip(writes, writes[1:]):
+        if address1 + len(bytes1) > address2:
+            raise ValueError(table1 + " string at " + hex(address1) + " overlaps " + table2 + " string at " + hex(address2))
+
+    for table_name, address, en_bytes in writes:
+        for start, end in kept_regions:
+            if address < end and start < address + len(en_bytes):
+                raise ValueError(table_name + " string at " + hex(address) + " overlaps the untranslated japanese at " + hex(start))
+
+
+def patch_exe(tables, input_path, output_path, free_regions=None):
+    '''
+    write every pointer table and string block straight into a copy of the exe
+    the whole thing gets read once, patched in memory, and written once
+    '''
+    if Path(output_path).resolve() == Path(input_path).resolve():
+        raise ValueError("not overwriting the original exe " + str(input_path) + ", pick another output")
+
+    clears = []
+    writes = []
+    for table_name, table in tables.items():
+        table_clears, table_writes = get_string_writes(table, table_name, free_regions)
+        clears += table_clears
+        writes += table_writes
+    kept_regions = get_kept_regions(tables)
+    check_overlaps(writes, kept_regions)
+
+    # untranslated strings still get pointed at, so they never get cleared (even inside another table's block)
+    cleared = FreeSpace()
+    for table_name, block, start_address, end_address in clears:
+        cleared.add(start_address, end_address)
+    for start_address, end_address in kept_regions:
+        cleared.remove(start_address, end_address)
+
+    with RomImage(input_path) as rom:
+        exe = bytearray(rom.buffer)
+
+        # clear all the old japanese first, so one table can't wipe out another's strings
+        for start_address, end_address in cleared:
+            start = rom.ram_to_offset(start_address)
+            exe[start:start + end_address - start_address] = bytes(end_address - start_address)
+
+        for table_name, address, en_bytes in writes:
+            start = rom.ram_to_offset(address)
+            exe[start:start + len(en_bytes)] = en_bytes
+
+        n_pointers = 0
+        for table_name, table in tables.items():
+            # no english yet, leave the pointer alone
+            translated = table.lengths["en_bytes"] != 0
+            pointers = table.integers["jp_pointer"][translated].tolist()
+            for pointer, address in zip(pointers, table.integers["en_address"][translated].tolist()):
+                struct.pack_into("<I", exe, rom.ram_to_offset(pointer), address)
+                n_pointers += 1
+
+    with open(output_path, "wb") as f:
+        f.write(exe)
+
+    print("Patched", n_pointers, "pointers and", len(writes), "strings into", output_path)
+
+
+def patch_translations(input_files, input_path, output_path, dictionary=None):
+    '''
+    lay out every table (sharing strings and moving overflow into free space) and patch the exe
+    with a dictionary (compress_strings), the strings get compressed; the dictionary itself isn't written to the exe
+    '''
+    spare_regions = read_spare_regions()
+    with RomImage(input_path) as rom:
+        tables, savings, (free_space, relocated, stuck) = prepare_pooled_tables(input_files, relocate=True, spare_regions=spare_regions,
+                                                                                rom=rom, dictionary=dictionary)
+    print_layout_report(tables, free_space, relocated, stuck)
+
+    # relocated strings don't count as placed here, so this is the free space they were allocated from
+    free_regions = build_free_space(tables, spare_regions)
+    patch_exe(tables, input_path, output_path, free_regions)
+
+
+
+
+if __name__ == "__main__":
+
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("SLPS_004.76")
+    if len(sys.argv) > 2:
+        input_files = [Path(arg) for arg in sys.argv[2:]]
+    else:
+        input_files = sorted(translations_path.glob("*.csv"))
+
+    patch_translations(input_files, Path(__file__).resolve().parent / rom_path, output_path)
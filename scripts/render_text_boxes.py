@@ -0,0 +1,162 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+import numpy as np
+import csv
+import sys
+
+from string_table import StringTable
+from ascii_text import encode_ascii
+from decode_char_tiles import decode_tile_bytes
+from encode_char_tiles import char_width, tile_height, row_height, encode_tilesets
+from create_ascii_binary import image_paths, n_row_bytes
+from string_pool import translations_path
+
+output_path = "text_boxes"
+report_file_name = "text_boxes_report.csv"
+
+# the game draws characters in pairs, 8px for the even one and 6px for the odd one
+pair_width = 14
+slot_starts = [0, 8]
+
+# every byte of a string is half a fullwidth character, so 7px on screen
+byte_width = 7
+
+# how the pngs look
+scale = 3
+overflow_color = 192
+
+# pre-decoded tiles for the worker processes, (n_codes, even/odd, tile_height, 8)
+glyph_tiles = None
+
+
+def get_glyph_tiles():
+    '''
+    encode the even and odd tilesets the same way create_ascii_binary does, then decode them back
+    so the render shows exactly what ends up in the game
+    '''
+    tile_bytes = np.frombuffer(encode_tilesets(image_paths, char_width, tile_height, row_height, n_row_bytes), dtype=np.uint8)
+    tiles = decode_tile_bytes(tile_bytes, n_row_bytes) != 0
+    return tiles.reshape(-1, len(image_paths), tile_height, 8 * n_row_bytes)
+
+
+def set_glyph_tiles(tiles):
+    global glyph_tiles
+    glyph_tiles = tiles
+
+
+def get_field_width(jp_text):
+    '''
+    width in pixels of the japanese string the english replaces
+    goes by jp_text, since some jp_string cells got mangled into numbers by a spreadsheet
+    '''
+    return byte_width * len(jp_text.encode("shift_jis", errors="replace"))
+
+
+def render_bytes(en_bytes, tiles):
+    '''
+    draw the bytes encode_ascii made, up to the terminator, the way the game does
+    even characters come from the even tileset and odd ones from the odd tileset,
+    so the capital-after-space codes only show up when the space is at an even index
+    returns an ink array
+    '''
+    if en_bytes == "":
+        return np.zeros((tile_height, 0), dtype=bool)
+
+    codes = en_bytes[:en_bytes.index(b"\x00")]
+    n_pairs = -(-len(codes) // 2)
+    ink = np.zeros((tile_height, pair_width * n_pairs + 8), dtype=bool)
+    for i, code in enumerate(codes):
+        left = pair_width * (i // 2) + slot_starts[i % 2]
+        ink[:, left:left + 8] |= tiles[code, i % 2]
+
+    return ink
+
+
+def get_text_width(ink):
+    '''
+    up to the last column with any ink in it, so trailing spaces don't count
+    '''
+    columns = np.flatnonzero(ink.any(axis=0))
+    return int(columns[-1]) + 1 if len(columns) else 0
+
+
+def save_text_box(ink, field_width, file_name):
+    '''
+    black text on white, with everything past the end of the field greyed out
+    '''
+    width = max(ink.shape[1], field_width)
+    pixels = np.full((tile_height, width), 255, dtype=np.uint8)
+    pixels[:, field_width:] = overflow_color
+    pixels[:, :ink.shape[1]][ink] = 0
+
+    pixels = pixels.repeat(scale, axis=0).repeat(scale, axis=1)
+    Image.fromarray(pixels).save(file_name)
+
+
+def render_table(input_file):
+    '''
+    render every row of one translation csv and return its rows for the report
+    runs in a worker process with the tiles already decoded
+    '''
+    table_name = Path(input_file).stem
+    table_path = Path(output_path) / table_name
+    table_path.mkdir(parents=True, exist_ok=True)
+
+    table = StringTable.read(input_file)
+
+    rows = []
+    for i, row in enumerate(table):
+        # words in the table that aren't pointers
+        if row.jp_string == b"":
+            continue
+
+        jp_pointer = table.get_csv_value("jp_pointer", i)
+        jp_text = row.jp_text
+        en_text = row.en_text
+
+        ink = render_bytes(encode_ascii(en_text), glyph_tiles)
+        field_width = get_field_width(jp_text)
+        text_width = get_text_width(ink)
+        overflow = text_width > field_width
+
+        save_text_box(ink, field_width, table_path / (format(i, "03d") + "_" + str(jp_pointer) + ".png"))
+        rows.append([table_name, jp_pointer, en_text, field_width, text_width, overflow])
+
+    return rows
+
+
+def render_text_boxes(input_files):
+    '''
+    render every table, spread over all cores
+    '''
+    # decode once here, every worker gets its own copy when it starts
+    tiles = get_glyph_tiles()
+    with ProcessPoolExecutor(initializer=set_glyph_tiles, initargs=(tiles,)) as executor:
+        results = list(executor.map(render_table, input_files))
+
+    report_path = Path(output_path) / report_file_name
+    with open(report_path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["table", "jp_pointer", "en_text", "field_width", "text_width", "overflow"])
+        for rows in results:
+            writer.writerows(rows)
+
+    overflows = [row for rows in results for row in rows if row[5]]
+    print("Rendered", sum(len(rows) for rows in results), "strings into", output_path)
+    print(len(overflows), "strings overflow their field")
+    for table_name, jp_pointer, en_text, field_width, text_width, overflow in overflows:
+        print("   ", table_name, jp_pointer, repr(en_text), text_width, ">", field_width, "px")
+    print("Created", report_path)
+
+
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        input_files = [Path(arg) for arg in sys.argv[1:]]
+    else:
+        input_files = sorted(translations_path.glob("*.csv"))
+
+    render_text_boxes(input_files)
@@ -0,0 +1,125 @@
+import hashlib
+import mmap
+
+from instrument import rom_read
+from disc_image import DiscImage, is_disc_image, exe_path
+
+# ps-x exe header layout
+# the header is one 0x800 byte sector, then the code gets copied to ram at the load address
+exe_magic = b"PS-X EXE"
+exe_header_size = 0x800
+exe_initial_pc_offset = 0x10
+exe_load_address_offset = 0x18
+exe_text_size_offset = 0x1c
+
+
+class RomImage:
+    '''
+    read-only view of the exe, mapped into memory once
+    replaces seeking and reading the file one byte at a time
+    the path can also be a disc image, then the exe (or disc_file) gets read straight off of it
+    '''
+
+    def __init__(self, path, disc_file=exe_path):
+        self.path = path
+        if is_disc_image(path):
+            with DiscImage(path) as disc:
+                data = disc.read_file(disc_file)
+            self.file = None
+            self.map = None
+            self.buffer = memoryview(data)
+        else:
+            self.file = open(path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buffer = memoryview(self.map)
+
+        # for anything derived from the rom that only needs to be built once
+        self.cache = {}
+
+        # only trust the load address if this is actually an exe
+        if self.buffer[:len(exe_magic)] == exe_magic:
+            self.load_address = self.read_u32(exe_load_address_offset)
+            self.text_size = self.read_u32(exe_text_size_offset)
+        else:
+            self.load_address = None
+            self.text_size = len(self.buffer)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        release the memoryview before the map, or mmap complains
+        if someone is still holding a slice, the map stays open until they let go
+        '''
+        self.buffer.release()
+        if self.map is None:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+    def get_hash(self):
+        '''
+        sha1 of the whole file, for keying caches of stuff built from it
+        '''
+        if "hash" not in self.cache:
+            self.cache["hash"] = hashlib.sha1(self.buffer).hexdigest()
+        return self.cache["hash"]
+
+    @rom_read
+    def read_int(self, position, n_bytes):
+        '''
+        return an unsigned little endian int from some bytes at the specified position
+        '''
+        return int.from_bytes(self.buffer[position:position + n_bytes], byteorder="little")
+
+    def read_u8(self, position):
+        return self.buffer[position]
+
+    def read_u16(self, position):
+        return self.read_int(position, 2)
+
+    def read_u32(self, position):
+        return self.read_int(position, 4)
+
+    @rom_read
+    def slice(self, position, n_bytes):
+        '''
+        zero-copy view of some bytes at the specified position
+        '''
+        return self.buffer[position:position + n_bytes]
+
+    def ram_to_offset(self, ram_address):
+        '''
+        convert a ram address (like 0x800a35f8) to a position in the exe
+        '''
+        if self.load_address is None:
+            raise ValueError("not a ps-x exe, can't convert ram addresses")
+
+        offset = ram_address - self.load_address + exe_header_size
+        if not exe_header_size <= offset < len(self.buffer):
+            raise ValueError("ram address " + hex(ram_address) + " is outside of the exe")
+        return offset
+
+    def offset_to_ram(self, offset):
+        '''
+        convert a position in the exe to a ram address
+        '''
+        if self.load_address is None:
+            raise ValueError("not a ps-x exe, can't convert ram addresses")
+        return offset - exe_header_size + self.load_address
+
+    def read_int_at_ram(self, ram_address, n_bytes):
+        return self.read_int(self.ram_to_offset(ram_address), n_bytes)
+
+    def slice_at_ram(self, ram_address, n_bytes):
+        return self.slice(self.ram_to_offset(ram_address), n_bytes)
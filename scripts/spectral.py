@@ -0,0 +1,249 @@
+from pathlib import Path
+import argparse
+import sys
+
+# everything heavy (numpy, PIL) gets imported inside the subcommand that needs it,
+# so this file has to stay light: only the standard library up here
+
+scripts_path = Path(__file__).resolve().parent
+repo_path = scripts_path.parent
+translations_path = repo_path / "translations"
+
+# same place decode_char_tiles.rom_path points, without importing numpy to find out
+default_rom_file = repo_path / "rom" / "SLPS_004.76"
+rom_help = "the exe, or a disc image (.bin, .cue or .iso) to read it from"
+
+
+def get_input_files(paths):
+    '''
+    the csvs given on the command line, or every translation csv
+    '''
+    if paths:
+        return [Path(path) for path in paths]
+    return sorted(translations_path.glob("*.csv"))
+
+
+def run_extract(args):
+    from rom_image import RomImage
+    from find_pointer_tables import find_pointer_tables, write_candidate_csv
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    with RomImage(args.rom) as rom:
+        candidates = find_pointer_tables(rom)
+        print(len(candidates), "candidate pointer tables")
+        for address, length, japanese_fraction in candidates[:args.count]:
+            file_name = write_candidate_csv(rom, address, length, args.output)
+            print(hex(address), length, "pointers,", format(japanese_fraction, ".0%"), "japanese ->", file_name)
+
+
+def run_convert(args):
+    from convert_ghidra_csv import create_new_csv
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for input_file in args.csvs:
+        create_new_csv(Path(input_file), args.output)
+
+
+def write_dictionary(input_files, output_path):
+    '''
+    the pair dictionary for --dte, checked before anything gets written
+    '''
+    from compress_strings import get_checked_dictionary, dictionary_file_name
+    from dte_text import get_dictionary_bytes
+
+    try:
+        dictionary = get_checked_dictionary(input_files)
+    except ValueError as error:
+        raise SystemExit(error)
+    (output_path / dictionary_file_name).write_bytes(get_dictionary_bytes(dictionary))
+    print("Created file", dictionary_file_name, "with", len(dictionary), "pairs")
+    return dictionary
+
+
+def run_pack(args):
+    from string_table import prepare_for_writing, get_table_name, get_binaries
+    from allocate_strings import allocators
+
+    if args.allocator not in allocators:
+        raise SystemExit("allocator must be one of " + ", ".join(allocators))
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    input_files = get_input_files(args.csvs)
+
+    dictionary = None
+    if args.dte:
+        dictionary = write_dictionary(input_files, args.output)
+
+    # build every table before writing any, so a string that fits in no block doesn't leave half a pack behind
+    files = []
+    try:
+        for input_file in input_files:
+            table = prepare_for_writing(input_file, args.allocator, dictionary)
+            files += get_binaries(table, get_table_name(input_file))
+    except ValueError as error:
+        raise SystemExit(error)
+
+    for file_name, data in files:
+        (args.output / file_name).write_bytes(data)
+        print("Created file", file_name)
+
+
+def run_build_tiles(args):
+    from create_ascii_binary import build_full, build_incremental
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    if args.incremental:
+        build_incremental(args.output)
+    else:
+        build_full(args.output)
+
+
+def run_decode(args):
+    from export_font_atlas import export_font_atlas
+
+    export_font_atlas(args.rom, args.output)
+
+
+def run_census(args):
+    from rom_image import RomImage
+    from glyph_census import take_census, get_reclaimable_ranges, print_census, take_tiles, add_spare_regions
+
+    with RomImage(args.rom) as rom:
+        counts, unused = take_census(rom, get_input_files(args.csvs), scan=not args.no_scan)
+        ranges = get_reclaimable_ranges(unused, args.min_tiles)
+        print_census(rom, counts, unused, ranges, args.min_tiles)
+
+        if args.tiles:
+            for tile_index, code, offset in take_tiles(rom, ranges, args.tiles):
+                print("   ", "slot", tile_index, "code", format(code, "04x"), "at", hex(offset))
+        if args.spare:
+            from free_space import spare_regions_path
+            print("Added", add_spare_regions(rom, ranges), "regions to", spare_regions_path)
+
+
+def run_patch(args):
+    from patch_exe import patch_translations
+
+    input_files = get_input_files(args.csvs)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    dictionary = None
+    if args.dte:
+        dictionary = write_dictionary(input_files, args.output.parent)
+    patch_translations(input_files, args.rom, args.output, dictionary)
+
+    if args.disc:
+        from disc_image import get_bin_path, patch_file
+
+        bin_path = get_bin_path(args.disc)
+        changed = patch_file(bin_path, args.disc_file, args.output.read_bytes())
+        print("Rewrote", len(changed), "sectors of", args.disc_file, "in", bin_path)
+
+
+def run_splice(args):
+    from splice_exe_header import splice_exe_header, print_report
+
+    load_address = int(args.load_address, 16) if args.load_address else None
+    try:
+        header, original_header, regions = splice_exe_header(args.rom, args.export, args.output, load_address)
+    except ValueError as error:
+        raise SystemExit(error)
+    print_report(header, original_header, regions, args.output)
+
+
+def run_disc(args):
+    from disc_image import DiscImage
+
+    with DiscImage(args.image) as disc:
+        if not args.files:
+            for file_path, (lba, size) in sorted(disc.list_files().items()):
+                print(format(lba, ">8"), format(size, ">10"), file_path)
+            return
+
+        args.output.mkdir(parents=True, exist_ok=True)
+        for file_path in args.files:
+            output_file = args.output / Path(file_path).name
+            n_bytes = disc.extract_file(file_path, output_file)
+            print("Extracted", file_path, "(" + str(n_bytes), "bytes) to", output_file)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="spectral", description="spectral tower translation tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract = subparsers.add_parser("extract", help="find pointer tables in the exe and save them as csvs")
+    extract.add_argument("--rom", type=Path, default=default_rom_file, help=rom_help)
+    extract.add_argument("--output", type=Path, default=Path("pointer_tables"))
+    extract.add_argument("--count", type=int, default=20, help="how many of the best candidates to save")
+    extract.set_defaults(run=run_extract)
+
+    convert = subparsers.add_parser("convert", help="add japanese text to csvs exported from ghidra")
+    convert.add_argument("csvs", nargs="+")
+    convert.add_argument("--output", type=Path, default=Path("."))
+    convert.set_defaults(run=run_convert)
+
+    pack = subparsers.add_parser("pack", help="write pointer table and string block binaries")
+    pack.add_argument("csvs", nargs="*", help="defaults to every translation csv")
+    pack.add_argument("--allocator", default="best_fit_decreasing")
+    pack.add_argument("--output", type=Path, default=Path("."))
+    pack.add_argument("--dte", action="store_true", help="compress the english strings with a pair dictionary mined from every translation csv")
+    pack.set_defaults(run=run_pack)
+
+    build_tiles = subparsers.add_parser("build-tiles", help="encode the ascii tilesets")
+    build_tiles.add_argument("--output", type=Path, default=Path("ASCII"))
+    build_tiles.add_argument("--incremental", action="store_true", help="only re-encode tiles that changed")
+    build_tiles.set_defaults(run=run_build_tiles)
+
+    decode = subparsers.add_parser("decode", help="render every font tile in the exe to png sheets")
+    decode.add_argument("--rom", type=Path, default=default_rom_file, help=rom_help)
+    decode.add_argument("--output", type=Path, default=Path("font_atlas"))
+    decode.set_defaults(run=run_decode)
+
+    census = subparsers.add_parser("census", help="find kanji tiles no string draws anymore")
+    census.add_argument("csvs", nargs="*", help="defaults to every translation csv")
+    census.add_argument("--rom", type=Path, default=default_rom_file, help=rom_help)
+    census.add_argument("--no-scan", action="store_true", help="only look at the csvs, not every pointer table in the exe")
+    census.add_argument("--min-tiles", type=int, default=4, help="smallest range worth reporting")
+    census.add_argument("--tiles", type=int, default=0, help="list this many free slots for new tiles")
+    census.add_argument("--spare", action="store_true", help="add the ranges to spare_regions.csv for string relocation")
+    census.set_defaults(run=run_census)
+
+    patch = subparsers.add_parser("patch", help="write the translations straight into a copy of the exe")
+    patch.add_argument("csvs", nargs="*", help="defaults to every translation csv")
+    patch.add_argument("--rom", type=Path, default=default_rom_file, help=rom_help)
+    patch.add_argument("--output", type=Path, default=Path("SLPS_004.76"))
+    patch.add_argument("--disc", help="also put the new exe into this .bin or .cue")
+    patch.add_argument("--disc-file", default="SLPS_004.76", help="where the exe is on the disc")
+    patch.add_argument("--dte", action="store_true", help="compress the english strings, and save the pair dictionary next to the output")
+    patch.set_defaults(run=run_patch)
+
+    splice = subparsers.add_parser("splice", help="put the exe header back on a ghidra raw binary export")
+    splice.add_argument("export", type=Path)
+    splice.add_argument("--rom", type=Path, default=default_rom_file, help="where the header comes from; " + rom_help)
+    splice.add_argument("--output", type=Path, default=Path("SLPS_004.76"))
+    splice.add_argument("--load-address", help="where the export starts in ram, in hex, if it isn't where the original loads")
+    splice.set_defaults(run=run_splice)
+
+    disc = subparsers.add_parser("disc", help="list the files on a disc image, or copy some of them out")
+    disc.add_argument("image", help=".bin, .cue or .iso")
+    disc.add_argument("files", nargs="*", help="paths on the disc to copy out, lists everything if there are none")
+    disc.add_argument("--output", type=Path, default=Path("."))
+    disc.set_defaults(run=run_disc)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    # the other scripts import each other by name
+    if str(scripts_path) not in sys.path:
+        sys.path.insert(0, str(scripts_path))
+
+    args.run(args)
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,253 @@
+from pathlib import Path
+import numpy as np
+import struct
+import sys
+
+from rom_image import exe_magic, exe_header_size, exe_initial_pc_offset, exe_load_address_offset, exe_text_size_offset
+from disc_image import DiscImage, is_disc_image, exe_path
+
+# ghidra's raw binary export is just the code and data from the load address on, without the header,
+# so splice the original header back on before psxbuilder gets it
+
+# files get read and compared this much at a time, so memory doesn't grow with the exe
+chunk_size = 0x40000
+
+# the text section is loaded in whole cd sectors
+text_alignment = 0x800
+
+# changes closer together than this get reported as one region
+merge_gap = 16
+
+
+def iter_chunks(path):
+    '''
+    a file chunk by chunk, or the exe off a disc image sector by sector
+    '''
+    if is_disc_image(path):
+        with DiscImage(path) as disc:
+            yield from disc.iter_file(exe_path)
+        return
+
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+class ChunkReader:
+    '''
+    read exact amounts from a stream of chunks
+    '''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def read(self, n_bytes):
+        while len(self.buffer) < n_bytes:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data = self.buffer[:n_bytes]
+        self.buffer = self.buffer[n_bytes:]
+        return data
+
+
+def get_header_fields(header):
+    initial_pc, = struct.unpack_from("<I", header, exe_initial_pc_offset)
+    load_address, = struct.unpack_from("<I", header, exe_load_address_offset)
+    text_size, = struct.unpack_from("<I", header, exe_text_size_offset)
+    return initial_pc, load_address, text_size
+
+
+def check_header(header, file_size):
+    '''
+    make sure a header describes the file it's on, returns a list of problems
+    '''
+    if header[:len(exe_magic)] != exe_magic:
+        return ["it doesn't start with " + repr(exe_magic) + ", so it isn't a ps-x exe"]
+
+    problems = []
+    initial_pc, load_address, text_size = get_header_fields(header)
+    if text_size % text_alignment != 0:
+        problems.append("the text size " + hex(text_size) + " isn't whole sectors")
+    if text_size != file_size - exe_header_size:
+        problems.append("the text size " + hex(text_size) + " doesn't match the " + hex(file_size - exe_header_size) + " bytes after the header")
+    if not load_address <= initial_pc < load_address + text_size:
+        problems.append("the entry point " + hex(initial_pc) + " isn't in the code")
+    return problems
+
+
+def fix_header(header, export_size, load_address=None):
+    '''
+    the original header with the text size (and load address, if given) set for the export
+    '''
+    header = bytearray(header)
+    padded_size = -(-export_size // text_alignment) * text_alignment
+    struct.pack_into("<I", header, exe_text_size_offset, padded_size)
+    if load_address is not None:
+        struct.pack_into("<I", header, exe_load_address_offset, load_address)
+    return bytes(header)
+
+
+def get_changed_runs(old, new, offset):
+    '''
+    [start, end) file offsets of every run of differing bytes between two chunks of the same length
+    '''
+    changed = np.flatnonzero(np.frombuffer(old, dtype=np.uint8) != np.frombuffer(new, dtype=np.uint8))
+    if len(changed) == 0:
+        return []
+
+    # a run ends wherever the next changed byte isn't right after this one
+    breaks = np.flatnonzero(np.diff(changed) != 1)
+    starts = changed[np.concatenate([[0], breaks + 1])] + offset
+    ends = changed[np.concatenate([breaks, [len(changed) - 1]])] + 1 + offset
+    return zip(starts.tolist(), ends.tolist())
+
+
+def add_region(regions, start, end):
+    '''
+    add a changed region, merging it into the last one if they're close
+    '''
+    if regions and start - regions[-1][1] <= merge_gap:
+        regions[-1][1] = max(regions[-1][1], end)
+    else:
+        regions.append([start, end])
+
+
+def skip(reader, n_bytes):
+    '''
+    read past some bytes a chunk at a time, returns how many there were
+    '''
+    n_skipped = 0
+    while n_skipped < n_bytes:
+        n_read = len(reader.read(min(chunk_size, n_bytes - n_skipped)))
+        if n_read == 0:
+            break
+        n_skipped += n_read
+    return n_skipped
+
+
+def splice_exe_header(original_path, export_path, output_path, load_address=None):
+    '''
+    write the original header plus the export, padded to whole sectors, comparing it with the original as it goes
+    the output goes to a temporary file first, and only replaces output_path once it reads back as a good exe
+    only a chunk of each file is ever in memory
+    returns the new header, the original header, and the changed [start, end) regions:
+    file offsets in the header, ram addresses after it (so a new load address doesn't make everything look moved)
+    '''
+    output_path = Path(output_path)
+    for input_path in (original_path, export_path):
+        if output_path.resolve() == Path(input_path).resolve():
+            raise ValueError("not overwriting " + str(input_path) + ", pick another output")
+
+    export_size = Path(export_path).stat().st_size
+    original = ChunkReader(iter_chunks(original_path))
+    original_header = original.read(exe_header_size)
+
+    with open(export_path, "rb") as f:
+        start = f.read(len(exe_magic))
+    if start == exe_magic:
+        raise ValueError(str(export_path) + " already has a header")
+
+    if original_header[:len(exe_magic)] != exe_magic:
+        raise ValueError(str(original_path) + " isn't a ps-x exe")
+
+    header = fix_header(original_header, export_size, load_address)
+    padded_size = get_header_fields(header)[2]
+    problems = check_header(header, exe_header_size + padded_size)
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    regions = []
+    if header != original_header:
+        for start, end in get_changed_runs(original_header, header, 0):
+            add_region(regions, start, end)
+
+    # line the two up by ram address: old_ram is where the next byte of the original loads
+    ram = get_header_fields(header)[1]
+    old_ram = get_header_fields(original_header)[1]
+    if old_ram < ram:
+        n_skipped = skip(original, ram - old_ram)
+        add_region(regions, old_ram, old_ram + n_skipped)
+        old_ram += n_skipped
+
+    end_ram = ram + padded_size
+    temp_path = output_path.with_name(output_path.name + ".part")
+    try:
+        with open(export_path, "rb") as export, open(temp_path, "wb") as output:
+            output.write(header)
+            while ram < end_ram:
+                data = export.read(chunk_size)
+                if len(data) < chunk_size:
+                    data += bytes(min(chunk_size, end_ram - ram) - len(data))
+                output.write(data)
+
+                # anything before the original starts is new
+                n_new = min(max(old_ram - ram, 0), len(data))
+                if n_new:
+                    add_region(regions, ram, ram + n_new)
+
+                old = original.read(len(data) - n_new)
+                for start, end in get_changed_runs(old, data[n_new:n_new + len(old)], ram + n_new):
+                    add_region(regions, start, end)
+                if n_new + len(old) < len(data):
+                    add_region(regions, ram + n_new + len(old), ram + len(data))
+                old_ram += len(old)
+                ram += len(data)
+
+        # read back what actually got written
+        with open(temp_path, "rb") as f:
+            problems = check_header(f.read(exe_header_size), temp_path.stat().st_size)
+        if problems:
+            raise ValueError(str(output_path) + ": " + "; ".join(problems))
+        temp_path.replace(output_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+    # whatever's left of the original got cut off
+    n_left = skip(original, float("inf"))
+    if n_left:
+        add_region(regions, old_ram, old_ram + n_left)
+
+    return header, original_header, regions
+
+
+def print_report(header, original_header, regions, output_path):
+    initial_pc, load_address, text_size = get_header_fields(header)
+    old_text_size = get_header_fields(original_header)[2]
+
+    old_load_address = get_header_fields(original_header)[1]
+
+    print("Wrote", output_path, "loading at", hex(load_address), "entry", hex(initial_pc))
+    if load_address != old_load_address:
+        print("load address", hex(old_load_address), "->", hex(load_address))
+    if text_size != old_text_size:
+        print("text size", hex(old_text_size), "->", hex(text_size))
+
+    n_changed = sum(end - start for start, end in regions)
+    print(len(regions), "changed regions,", n_changed, "bytes")
+    for start, end in regions:
+        if start < exe_header_size:
+            print("   ", "header", hex(start), "-", hex(end))
+        elif load_address <= start < load_address + text_size:
+            print("   ", "ram", hex(start), "-", hex(end), "file", hex(start - load_address + exe_header_size), end - start, "bytes")
+        else:
+            print("   ", "ram", hex(start), "-", hex(end), "no longer loaded,", end - start, "bytes")
+
+
+
+if __name__ == "__main__":
+    '''
+    python splice_exe_header.py <original exe or disc> <ghidra raw export> [output]
+    '''
+    original_path = Path(sys.argv[1])
+    export_path = Path(sys.argv[2])
+    output_path = Path(sys.argv[3]) if len(sys.argv) > 3 else Path("SLPS_004.76")
+
+    header, original_header, regions = splice_exe_header(original_path, export_path, output_path)
+    print_report(header, original_header, regions, output_path)
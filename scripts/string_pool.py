@@ -0,0 +1,173 @@
+from pathlib import Path
+import numpy as np
+import sys
+
+from string_table import (StringTable, add_ascii_bytes, add_compressed_bytes, add_byte_lengths, add_japanese_block_indices, assign_english_addresses,
+                          get_japanese_lengths, get_table_name)
+from create_translation_binary import create_pointer_table, create_string_data
+from free_space import relocate_overflow
+from allocate_strings import alignment
+from find_pointer_tables import get_string
+
+translations_path = Path(__file__).resolve().parent.parent / "translations"
+
+
+def get_core_bytes(en_bytes):
+    '''
+    the part of an encoded string the game actually reads: everything up to and including the first zero
+    '''
+    return en_bytes[:en_bytes.index(b"\x00") + 1]
+
+
+def pool_strings(tables):
+    '''
+    find strings that can be shared between rows of all the tables
+    identical strings are only stored once, and so are strings that are the tail end of a longer one
+    ("Dummy" can point into "            Dummy", as long as it still starts on a word boundary)
+    the first row to use a string keeps it, and every other row's length gets set to 0
+    returns where every row's string ends up: (table, row) -> (host table, host row, offset)
+    plus the number of bytes each table no longer has to store
+    '''
+    # first row that stores every distinct string
+    owners = {}
+    for table_name, table in tables.items():
+        for i in np.flatnonzero(table.integers["en_length"]).tolist():
+            owners.setdefault(get_core_bytes(table.get_bytes("en_bytes", i)), (table_name, i))
+
+    # sort by reversed bytes, so every string a string is the tail of comes right after it
+    # pointers have to stay word aligned, so a tail only shares with a stored string it starts a whole word into
+    cores = sorted(owners, key=lambda core: core[::-1])
+    hosts = {}
+    for k in range(len(cores) - 1, -1, -1):
+        hosts[cores[k]] = cores[k]
+        j = k + 1
+        while j < len(cores) and cores[j].endswith(cores[k]):
+            if hosts[cores[j]] == cores[j] and (len(cores[j]) - len(cores[k])) % alignment == 0:
+                hosts[cores[k]] = cores[j]
+                break
+            j += 1
+
+    references = {}
+    savings = {}
+    for table_name, table in tables.items():
+        savings[table_name] = 0
+        en_lengths = table.integers["en_length"]
+        # empty strings never get stored anyway
+        for i in np.flatnonzero(table.lengths["en_bytes"]).tolist():
+            core = get_core_bytes(table.get_bytes("en_bytes", i))
+            host = hosts[core]
+            host_table, host_row = owners[host]
+            references[(table_name, i)] = (host_table, host_row, len(host) - len(core))
+
+            if (host_table, host_row) != (table_name, i) and en_lengths[i] != 0:
+                savings[table_name] += int(en_lengths[i])
+                en_lengths[i] = 0
+
+    return references, savings
+
+
+def resolve_pooled_addresses(tables, references):
+    '''
+    once every table has been laid out, point each row at its shared string
+    rows that use a string stored by another table get block -1, so they aren't written twice
+    '''
+    for (table_name, i), (host_table, host_row, offset) in references.items():
+        host = tables[host_table]
+        table = tables[table_name]
+        table.integers["en_address"][i] = host.integers["en_address"][host_row] + offset
+        if host_table == table_name:
+            table.integers["en_block"][i] = host.integers["en_block"][host_row]
+        else:
+            table.integers["en_block"][i] = -1
+
+    return tables
+
+
+def add_exe_japanese_lengths(table, rom):
+    '''
+    recount every japanese length from its terminator in the exe, instead of trusting jp_string
+    repeated strings keep their length of 0
+    '''
+    jp_lengths = table.integers["jp_length"]
+    n_bytes = np.zeros(len(table), dtype=np.int64)
+    for i in np.flatnonzero(jp_lengths).tolist():
+        raw_bytes = get_string(rom, int(table.integers["jp_address"][i]))
+        if raw_bytes is None:
+            raise ValueError("no terminator after the japanese string at " + table.get_csv_value("jp_address", i))
+        n_bytes[i] = len(raw_bytes)
+
+    table.set_integers("jp_length", np.where(jp_lengths != 0, get_japanese_lengths(n_bytes), 0))
+    return table
+
+
+def keep_untranslated_strings(table, table_name):
+    '''
+    rows with no english yet keep pointing at their japanese, so it has to stay where it is
+    its length moves to kept_length, and with a jp_length of 0 it's left out of every block
+    '''
+    strings = table.lengths["jp_string"] != 0
+    untranslated = strings & (table.lengths["en_bytes"] == 0)
+    jp_addresses = table.integers["jp_address"]
+    mixed = set(jp_addresses[untranslated].tolist()) & set(jp_addresses[strings & ~untranslated].tolist())
+    if mixed:
+        raise ValueError(table_name + ": the strings at " + ", ".join(format(address, "08x") for address in sorted(mixed))
+                         + " are only translated in some rows")
+
+    jp_lengths = table.integers["jp_length"]
+    table.set_integers("kept_length", np.where(untranslated, jp_lengths, 0))
+    table.set_integers("jp_length", np.where(untranslated, 0, jp_lengths))
+    return table
+
+
+def prepare_pooled_tables(input_files, allocator="best_fit_decreasing", relocate=False, spare_regions=(), rom=None, dictionary=None):
+    '''
+    prepare_for_writing, but for all of the tables at once, sharing strings between them
+    with relocate, strings that don't fit their own table's blocks get moved into free space anywhere
+    (only patch_exe knows how to write those)
+    with a rom, the japanese lengths come from the exe, and untranslated strings are kept out of the blocks
+    with a dictionary, the english strings get compressed before they're shared
+    '''
+    tables = {}
+    for input_file in input_files:
+        table_name = get_table_name(input_file)
+        table = StringTable.read(input_file)
+        table = add_ascii_bytes(table)
+        if dictionary is not None:
+            table = add_compressed_bytes(table, dictionary)
+        table = add_byte_lengths(table)
+        if rom is not None:
+            table = add_exe_japanese_lengths(table, rom)
+            table = keep_untranslated_strings(table, table_name)
+        tables[table_name] = add_japanese_block_indices(table)
+
+    references, savings = pool_strings(tables)
+
+    for table_name, table in tables.items():
+        tables[table_name] = assign_english_addresses(table, allocator)
+
+    layout = None
+    if relocate:
+        layout = relocate_overflow(tables, spare_regions)
+
+    tables = resolve_pooled_addresses(tables, references)
+    return tables, savings, layout
+
+
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 1:
+        input_files = [Path(arg) for arg in sys.argv[1:]]
+    else:
+        input_files = sorted(translations_path.glob("*.csv"))
+
+    tables, savings, _ = prepare_pooled_tables(input_files)
+
+    for table_name in tables:
+        print(table_name, "saved", savings[table_name], "bytes by sharing strings")
+    print("total saved:", sum(savings.values()), "bytes")
+
+    for table_name, table in tables.items():
+        create_pointer_table(table, table_name)
+        create_string_data(table, table_name)
@@ -0,0 +1,372 @@
+from pathlib import Path
+from array import array
+import numpy as np
+import csv
+
+from ascii_text import encode_ascii
+from dte_text import compress_bytes
+from allocate_strings import get_english_addresses, check_placed
+from instrument import stage, count
+
+# addresses in the csvs are hex ram addresses, like 800a35f8
+# words in a pointer table that aren't pointers keep their value in jp_address, in decimal
+address_columns = ["jp_pointer", "jp_address"]
+
+# columns worked out while preparing a table, never saved
+derived_columns = ["jp_length", "jp_block", "en_length", "en_block", "en_address"]
+
+# jp_string is kept as raw shift jis (it's hex in the csv), en_bytes as encoded ascii,
+# everything else as utf-8 text
+raw_columns = ["jp_string", "en_bytes"]
+
+# where strings that fit in no block go, until they're moved or reported
+overflow_space = (0, 100000000)
+
+
+def get_table_name(input_file):
+    '''
+    get name of input file without ".csv"
+    '''
+    return Path(input_file).stem
+
+
+def get_output_file_name(table_name, start_address, end_address):
+    '''
+    format for binary file name
+    '''
+    return table_name + "_" + str(hex(start_address)) + "_" + str(hex(end_address)) + ".bin"
+
+
+def get_japanese_bytes(jp_string, jp_text):
+    '''
+    some jp_string cells got turned into numbers by a spreadsheet, so fall back on the text
+    '''
+    try:
+        return bytes.fromhex(jp_string)
+    except ValueError:
+        return jp_text.encode("shift_jis")
+
+
+class StringRow:
+    '''
+    a view of one row of a StringTable, nothing gets copied until you ask for it
+    '''
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, name):
+        return self.table.get(name, self.index)
+
+    def __repr__(self):
+        return "StringRow(" + ", ".join(name + "=" + repr(self.table.get(name, self.index)) for name in self.table.columns) + ")"
+
+
+class StringTable:
+    '''
+    a pointer table and its strings
+    integers live in numpy columns, and every string payload lives in one byte arena,
+    with a start and length per row for each string column
+    '''
+
+    def __init__(self, header, integers, arena, starts, lengths):
+        self.header = header # csv columns, in order
+        self.integers = integers # name -> int64 array
+        self.arena = arena
+        self.starts = starts # string column -> int64 array of offsets into the arena
+        self.lengths = lengths
+        self.columns = list(integers) + list(starts)
+
+    def __len__(self):
+        return len(self.integers["jp_pointer"])
+
+    def __getitem__(self, index):
+        return StringRow(self, index)
+
+    def __iter__(self):
+        return (StringRow(self, i) for i in range(len(self)))
+
+    @classmethod
+    @stage("read_table")
+    def read(cls, input_path):
+        '''
+        stream a translation csv straight into the arena, one row at a time
+        '''
+        arena = bytearray()
+        with open(input_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f, delimiter="\t")
+            header = next(reader)
+            string_columns = [name for name in header if name not in address_columns]
+            column_indices = {name: header.index(name) for name in header}
+
+            integers = {name: array("q") for name in address_columns + ["is_pointer"]}
+            starts = {name: array("q") for name in string_columns}
+            lengths = {name: array("q") for name in string_columns}
+
+            for row in reader:
+                row += [""] * (len(header) - len(row))
+                jp_string = row[column_indices["jp_string"]]
+                is_pointer = jp_string != ""
+                integers["is_pointer"].append(is_pointer)
+                integers["jp_pointer"].append(int(row[column_indices["jp_pointer"]], 16))
+                integers["jp_address"].append(int(row[column_indices["jp_address"]], 16 if is_pointer else 10))
+
+                for name in string_columns:
+                    value = row[column_indices[name]]
+                    if name == "jp_string":
+                        data = get_japanese_bytes(value, row[column_indices["jp_text"]]) if "jp_text" in column_indices else bytes.fromhex(value)
+                    else:
+                        data = value.encode("utf-8")
+                    starts[name].append(len(arena))
+                    lengths[name].append(len(data))
+                    arena += data
+
+        count("bytes_read", Path(input_path).stat().st_size)
+        integers = {name: np.frombuffer(column, dtype=np.int64).copy() for name, column in integers.items()}
+        starts = {name: np.frombuffer(column, dtype=np.int64).copy() for name, column in starts.items()}
+        lengths = {name: np.frombuffer(column, dtype=np.int64).copy() for name, column in lengths.items()}
+        return cls(header, integers, arena, starts, lengths)
+
+    def write(self, output_path):
+        '''
+        save in the same format it was read in, one row at a time
+        '''
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+            writer.writerow(self.header)
+            for i in range(len(self)):
+                writer.writerow([self.get_csv_value(name, i) for name in self.header])
+
+    def get_csv_value(self, name, i):
+        if name == "jp_pointer" or (name == "jp_address" and self.integers["is_pointer"][i]):
+            return format(int(self.integers[name][i]), "08x")
+        if name == "jp_address":
+            return str(int(self.integers[name][i]))
+        if name == "jp_string":
+            return self.get_bytes(name, i).hex()
+        return self.get(name, i)
+
+    def get_bytes(self, name, i):
+        start = self.starts[name][i]
+        return bytes(self.arena[start:start + self.lengths[name][i]])
+
+    def get(self, name, i):
+        if name in self.integers:
+            return int(self.integers[name][i])
+        if name in raw_columns:
+            return self.get_bytes(name, i)
+        return self.get_bytes(name, i).decode("utf-8")
+
+    def get_strings(self, name):
+        '''
+        a whole string column, as a list
+        '''
+        return [self.get(name, i) for i in range(len(self))]
+
+    def set_strings(self, name, values):
+        '''
+        replace (or add) a whole string column, appended to the arena in one go
+        '''
+        if name not in raw_columns:
+            values = [value.encode("utf-8") for value in values]
+        lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=len(values))
+        self.starts[name] = len(self.arena) + np.cumsum(lengths) - lengths
+        self.lengths[name] = lengths
+        self.arena += b"".join(values)
+        if name not in self.columns:
+            self.columns.append(name)
+
+    def set_integers(self, name, values):
+        self.integers[name] = np.asarray(values, dtype=np.int64)
+        if name not in self.columns:
+            self.columns.append(name)
+
+    def take(self, order):
+        '''
+        the rows in a new order; the arena is shared, only the offsets get shuffled
+        '''
+        integers = {name: column[order] for name, column in self.integers.items()}
+        starts = {name: column[order] for name, column in self.starts.items()}
+        lengths = {name: column[order] for name, column in self.lengths.items()}
+        return StringTable(self.header, integers, self.arena, starts, lengths)
+
+
+def add_japanese_text(table):
+    '''
+    decode every japanese string into a jp_text column
+    '''
+    table.set_strings("jp_text", [table.get_bytes("jp_string", i).decode("shift_jis", errors="replace") for i in range(len(table))])
+    if "jp_text" not in table.header:
+        table.header = table.header + ["jp_text"]
+    return table
+
+
+@stage()
+def add_ascii_bytes(table):
+    '''
+    encode every english string
+    '''
+    table.set_strings("en_bytes", [encode_ascii(text) or b"" for text in table.get_strings("en_text")])
+    return table
+
+
+@stage()
+def add_compressed_bytes(table, dictionary):
+    '''
+    dual tile encode every english string (see dte_text)
+    '''
+    table.set_strings("en_bytes", [compress_bytes(table.get_bytes("en_bytes", i), dictionary) for i in range(len(table))])
+    return table
+
+
+def get_japanese_lengths(n_bytes):
+    '''
+    how much room japanese strings of n_bytes take: a 2 byte terminator, then padding to a multiple of 4
+    (no string at all takes no room)
+    '''
+    n_bytes = np.asarray(n_bytes, dtype=np.int64)
+    padded = n_bytes + 2
+    jp_lengths = np.where(padded % 4 == 0, padded, padded + 2)
+    jp_lengths[n_bytes == 0] = 0
+    return jp_lengths
+
+
+@stage()
+def add_byte_lengths(table):
+    '''
+    add byte lengths for japanese and english
+    repeated strings get a length of 0
+    '''
+    jp_lengths = get_japanese_lengths(table.lengths["jp_string"])
+    en_lengths = table.lengths["en_bytes"].copy()
+
+    _, first_rows = np.unique(table.integers["jp_address"], return_index=True)
+    repeated = np.ones(len(table), dtype=bool)
+    repeated[first_rows] = False
+    jp_lengths[repeated] = 0
+    en_lengths[repeated] = 0
+
+    table.set_integers("jp_length", jp_lengths)
+    table.set_integers("en_length", en_lengths)
+    return table
+
+
+@stage()
+def add_japanese_block_indices(table):
+    '''
+    sort by japanese address and split into blocks of strings stored back to back
+    (stable, so the first copy of a repeated string stays in front of the copies with length 0)
+    a gap after the last real (nonzero length) string starts a new block
+    '''
+    table = table.take(np.argsort(table.integers["jp_address"], kind="stable"))
+    addresses = table.integers["jp_address"]
+    lengths = table.integers["jp_length"]
+
+    # end of the last real string before every row
+    real = lengths != 0
+    real[0] = True
+    last_real = np.maximum.accumulate(np.where(real, np.arange(len(table)), 0))
+    end_addresses = addresses[last_real] + lengths[last_real]
+    new_block = np.zeros(len(table), dtype=bool)
+    new_block[1:] = addresses[1:] > end_addresses[:-1]
+
+    table.set_integers("jp_block", np.cumsum(new_block))
+    return table
+
+
+def get_block_dictionary(table):
+    '''
+    block index -> (start address, end address), plus the overflow space at the end
+    the end is the end of the first string at the block's highest address
+    '''
+    addresses = table.integers["jp_address"]
+    blocks = table.integers["jp_block"]
+    last_rows = np.flatnonzero(np.diff(np.append(blocks, blocks[-1] + 1)))
+    first_rows = np.concatenate([[0], last_rows[:-1] + 1])
+    end_rows = np.searchsorted(addresses, addresses[last_rows], side="left")
+
+    block_dictionary = {}
+    for first, end in zip(first_rows.tolist(), end_rows.tolist()):
+        block_dictionary[int(blocks[first])] = (int(addresses[first]), int(addresses[end] + table.integers["jp_length"][end]))
+
+    block_dictionary[int(blocks[-1]) + 1] = overflow_space
+    return block_dictionary
+
+
+@stage()
+def assign_english_addresses(table, allocator="best_fit_decreasing"):
+    '''
+    use the block dictionary to assign starting addresses for english strings
+    see allocate_strings for the choice of allocators
+    '''
+    en_blocks, en_addresses = get_english_addresses(table.integers["en_length"].tolist(), table.integers["jp_address"].tolist(),
+                                                    get_block_dictionary(table), allocator)
+    table.set_integers("en_block", en_blocks)
+    table.set_integers("en_address", en_addresses)
+    return table
+
+
+@stage()
+def prepare_for_writing(input_file, allocator="best_fit_decreasing", dictionary=None):
+    '''
+    perform all of the necessary functions to get us ready to write the files
+    with a dictionary (compress_strings), the english strings get compressed too
+    '''
+    table = StringTable.read(input_file)
+    table = add_ascii_bytes(table)
+    if dictionary is not None:
+        table = add_compressed_bytes(table, dictionary)
+    table = add_byte_lengths(table)
+    table = add_japanese_block_indices(table)
+    table = assign_english_addresses(table, allocator)
+    return table
+
+
+@stage()
+def get_pointer_table(table, table_name):
+    '''
+    file name and contents of the english pointer table
+    every string has to be in a real block by now
+    '''
+    check_placed(table_name, table.get_strings("en_text"), table.integers["en_block"], table.integers["en_length"],
+                 get_block_dictionary(table))
+
+    order = np.argsort(table.integers["jp_pointer"], kind="stable")
+    pointers = table.integers["jp_pointer"]
+    file_name = get_output_file_name(table_name, int(pointers.min()), int(pointers.max()) + 4)
+    return file_name, table.integers["en_address"][order].astype("<u4").tobytes()
+
+
+@stage()
+def get_block_data(table, block, start_address, block_end_address):
+    '''
+    contents of one block: its strings at their addresses, filled out with zeros to the end of the block
+    a string past the end of the block is an error
+    '''
+    rows = np.flatnonzero((table.integers["en_block"] == block) & (table.integers["en_length"] != 0))
+
+    data = bytearray(block_end_address - start_address)
+    for i in rows:
+        address = int(table.integers["en_address"][i])
+        en_bytes = table.get_bytes("en_bytes", i)
+        position = address - start_address
+        if position < 0 or position + len(en_bytes) > len(data):
+            raise ValueError(repr(en_bytes) + " at " + hex(address) + " runs outside of block "
+                             + hex(start_address) + "-" + hex(block_end_address))
+        data[position:position + len(en_bytes)] = en_bytes
+
+    return bytes(data)
+
+
+def get_binaries(table, table_name):
+    '''
+    the pointer table and every block of a table, as (file name, contents)
+    the overflow block isn't one of them, get_pointer_table won't let anything stay in it
+    '''
+    files = [get_pointer_table(table, table_name)]
+    for block, (start_address, end_address) in list(get_block_dictionary(table).items())[:-1]:
+        files.append((get_output_file_name(table_name, start_address, end_address),
+                      get_block_data(table, block, start_address, end_address)))
+    return files
@@ -0,0 +1,172 @@
+from pathlib import Path
+import numpy as np
+import struct
+import sys
+
+from decode_char_tiles import (rom_path, text_color_table, chunk_table_nonkanji, chunk_table_kanji,
+                               tile_table_nonkanji, tile_table_kanji, tile_table_english,
+                               n_glyphs_nonkanji, shift_jis_chunk_ranges)
+from encode_char_tiles import char_width, tile_height, row_height, encode_tilesets
+from create_ascii_binary import image_paths, n_row_bytes
+from rom_image import exe_magic, exe_header_size, exe_initial_pc_offset, exe_load_address_offset, exe_text_size_offset
+from string_pool import translations_path
+from string_table import StringTable
+from find_pointer_tables import read_pointer_tables
+
+# the real exe is about this big, and everything decode_char_tiles needs fits inside it
+exe_size = 0x1a0000
+
+# where the code gets loaded, so the ram addresses in the translation csvs land in the file
+load_address = 0x80010000
+region_marker_offset = 0x4c
+region_marker = b"Sony Computer Entertainment Inc. for Japan area"
+
+# the color table only needs to decode: 4 bytes per color, 2 4bpp pixels per byte
+text_colors = [
+    [0x00, 0x10, 0x01, 0x11],
+    [0x00, 0x20, 0x02, 0x22],
+    [0x00, 0x30, 0x03, 0x33],
+]
+
+# same seed every time, so the same csvs always give the same rom (and the same cache hashes)
+seed = 476
+
+
+def get_n_glyphs_kanji(input_files):
+    '''
+    how many kanji tiles fit before the first pointer table or japanese string after the kanji table starts
+    (in the real exe, class_ptr_table comes right after the last kanji)
+    '''
+    offsets = [ram_to_offset(start) for name, start, end in read_pointer_tables()]
+    for input_file in input_files:
+        table = StringTable.read(input_file)
+        offsets += [ram_to_offset(jp_pointer) for jp_pointer in table.integers["jp_pointer"].tolist()]
+        offsets += [ram_to_offset(jp_address) for jp_address in table.integers["jp_address"][table.lengths["jp_string"] != 0].tolist()]
+
+    offsets = [offset for offset in offsets if offset >= tile_table_kanji] + [tile_table_english]
+    return (min(offsets) - tile_table_kanji) // 26
+
+
+def get_chunk_layout(n_glyphs_kanji):
+    '''
+    work out a chunk table entry (first code, first tile) for every chunk decode_char_tiles looks up
+    tiles are handed out in order, and chunks that would run off the end of their tile table
+    share the first tiles instead (the game reuses tiles for chunks nobody sees, too)
+    returns {(chunk table, chunk index): (first code, first tile)} and the number of tiles in each table
+    '''
+    chunks = {}
+    for byte1, start, end, chunk_table, chunk_index, n_skipped in shift_jis_chunk_ranges:
+        first_code = (byte1 << 8) + start
+        last_code = (byte1 << 8) + end
+        if (chunk_table, chunk_index) not in chunks:
+            chunks[(chunk_table, chunk_index)] = [first_code, last_code - first_code - n_skipped]
+            continue
+
+        # later ranges of the same chunk carry on from where it started (unless they're somewhere else entirely)
+        chunk = chunks[(chunk_table, chunk_index)]
+        if byte1 == chunk[0] >> 8:
+            chunk[1] = max(chunk[1], last_code - chunk[0] - n_skipped)
+
+    n_glyphs = {chunk_table_nonkanji: n_glyphs_nonkanji, chunk_table_kanji: n_glyphs_kanji}
+    next_tiles = {}
+    layout = {}
+    for (chunk_table, chunk_index), (first_code, n_tiles) in sorted(chunks.items()):
+        first_tile = next_tiles.get(chunk_table, 0)
+        limit = n_glyphs.get(chunk_table, 0)
+        if limit is not None and first_tile + n_tiles > limit:
+            first_tile = 0
+        else:
+            next_tiles[chunk_table] = first_tile + n_tiles
+        layout[(chunk_table, chunk_index)] = (first_code, first_tile)
+
+    return layout, next_tiles
+
+
+def write_header(rom):
+    rom[:len(exe_magic)] = exe_magic
+    struct.pack_into("<I", rom, exe_initial_pc_offset, load_address)
+    struct.pack_into("<I", rom, exe_load_address_offset, load_address)
+    struct.pack_into("<I", rom, exe_text_size_offset, len(rom) - exe_header_size)
+    rom[region_marker_offset:region_marker_offset + len(region_marker)] = region_marker
+
+
+def write_font(rom, rng, n_glyphs_kanji):
+    '''
+    chunk tables and noise tiles for the japanese tables, real tiles for the english one
+    '''
+    layout, n_tiles = get_chunk_layout(n_glyphs_kanji)
+    for (chunk_table, chunk_index), (first_code, first_tile) in layout.items():
+        struct.pack_into("<HH", rom, chunk_table + 4 * chunk_index, first_code, first_tile)
+
+    for i, colors in enumerate(text_colors):
+        rom[text_color_table + 4 * i:text_color_table + 4 * i + 4] = bytes(colors)
+
+    n_kanji = n_tiles[chunk_table_kanji]
+    rom[tile_table_nonkanji:tile_table_nonkanji + 26 * n_glyphs_nonkanji] = rng.bytes(26 * n_glyphs_nonkanji)
+    rom[tile_table_kanji:tile_table_kanji + 26 * n_kanji] = rng.bytes(26 * n_kanji)
+
+    english = encode_tilesets(image_paths, char_width, tile_height, row_height, n_row_bytes)
+    rom[tile_table_english:tile_table_english + len(english)] = english
+
+
+def ram_to_offset(address):
+    return address - load_address + exe_header_size
+
+
+def write_strings(rom, input_files):
+    '''
+    every pointer table and japanese string from the translation csvs, where the csvs say they are
+    '''
+    n_pointers = 0
+    for input_file in input_files:
+        table = StringTable.read(input_file)
+        for row in table:
+            pointer = ram_to_offset(row.jp_pointer)
+
+            # words in the table that aren't pointers were saved as plain numbers
+            if row.jp_string == b"":
+                struct.pack_into("<I", rom, pointer, row.jp_address)
+                continue
+
+            address = row.jp_address
+            raw_bytes = row.jp_string + b"\x00"
+            struct.pack_into("<I", rom, pointer, address)
+            rom[ram_to_offset(address):ram_to_offset(address) + len(raw_bytes)] = raw_bytes
+            n_pointers += 1
+
+    return n_pointers
+
+
+def build_synthetic_rom(input_files):
+    '''
+    a stand-in for SLPS_004.76 with everything the scripts read in the right place
+    '''
+    rom = bytearray(exe_size)
+    rng = np.random.default_rng(seed)
+
+    write_header(rom)
+    write_font(rom, rng, get_n_glyphs_kanji(input_files))
+    write_strings(rom, input_files)
+
+    return rom
+
+
+
+
+if __name__ == "__main__":
+    '''
+    python synthetic_rom.py [output path] [csvs...]
+    never overwrites a real rom
+    '''
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).resolve().parent / rom_path
+    if len(sys.argv) > 2:
+        input_files = [Path(arg) for arg in sys.argv[2:]]
+    else:
+        input_files = sorted(translations_path.glob("*.csv"))
+
+    if output_path.exists():
+        raise FileExistsError(str(output_path) + " already exists, not overwriting it")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(build_synthetic_rom(input_files))
+    print("Created synthetic rom", output_path)
@@ -0,0 +1,249 @@
+from pathlib import Path
+import numpy as np
+import ctypes.util
+import ctypes
+import hashlib
+import select
+import struct
+import time
+import sys
+import os
+
+from string_table import prepare_for_writing, get_table_name, get_binaries
+from create_ascii_binary import image_paths, get_sheet_cells, hash_bytes
+from encode_char_tiles import encode_cells
+from string_pool import translations_path
+
+ascii_file_name = "ASCII"
+
+# inotify event masks, from <sys/inotify.h>
+# editors either write the file in place or write a temp file and rename it over the old one
+in_close_write = 0x008
+in_moved_to = 0x080
+in_delete = 0x200
+in_moved_from = 0x040
+watch_mask = in_close_write | in_moved_to | in_delete | in_moved_from
+event_header = struct.Struct("iIII")
+
+# a save usually comes as a burst of events, wait this long for the rest of them
+settle_time = 0.01
+
+# how often to look at modification times when inotify isn't there (not linux)
+poll_interval = 0.2
+
+
+class InotifyWatcher:
+    '''
+    wait for files in some directories to change, straight from the kernel
+    '''
+
+    def __init__(self, directories):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        self.directories = {}
+        for directory in directories:
+            wd = self.libc.inotify_add_watch(self.fd, str(directory).encode(), watch_mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "can't watch " + str(directory))
+            self.directories[wd] = Path(directory)
+
+    def read_events(self):
+        changed = set()
+        buffer = os.read(self.fd, 65536)
+        position = 0
+        while position < len(buffer):
+            wd, mask, cookie, length = event_header.unpack_from(buffer, position)
+            position += event_header.size
+            name = buffer[position:position + length].rstrip(b"\x00").decode()
+            position += length
+            if wd in self.directories and name:
+                changed.add(self.directories[wd] / name)
+        return changed
+
+    def wait(self):
+        '''
+        block until something changes, then return every path that changed
+        '''
+        select.select([self.fd], [], [])
+        changed = self.read_events()
+        while select.select([self.fd], [], [], settle_time)[0]:
+            changed |= self.read_events()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    '''
+    same thing as InotifyWatcher, but by checking modification times
+    '''
+
+    def __init__(self, directories):
+        self.directories = [Path(directory) for directory in directories]
+        self.times = self.scan()
+
+    def scan(self):
+        times = {}
+        for directory in self.directories:
+            for path in directory.iterdir():
+                times[path] = path.stat().st_mtime_ns
+        return times
+
+    def wait(self):
+        while True:
+            time.sleep(poll_interval)
+            times = self.scan()
+            changed = {path for path in times.keys() | self.times.keys() if times.get(path) != self.times.get(path)}
+            self.times = times
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+def get_watcher(directories):
+    try:
+        return InotifyWatcher(directories)
+    except (OSError, AttributeError, TypeError):
+        print("inotify isn't available, checking for changes every", poll_interval, "seconds instead")
+        return PollingWatcher(directories)
+
+
+def get_target(path):
+    '''
+    which output a source file feeds into: one table per csv, and both ascii tilesets go into ASCII
+    '''
+    path = Path(path)
+    if path.parent == translations_path and path.suffix == ".csv":
+        return ("table", path)
+    if path in image_paths:
+        return ("ascii", None)
+    return None
+
+
+class Builder:
+    '''
+    keeps everything from the last build around, so a rebuild only redoes what changed
+    '''
+
+    def __init__(self, output_path):
+        self.output_path = Path(output_path)
+        self.output_hashes = {} # output file -> hash of what's in it
+        self.outputs = {} # target -> output files it made last time
+        self.sheet_hashes = [None] * len(image_paths)
+        self.sheet_tiles = [None] * len(image_paths)
+
+    def get_graph(self):
+        '''
+        every source file we know about and the target it rebuilds
+        '''
+        sources = sorted(translations_path.glob("*.csv")) + list(image_paths)
+        return {source: get_target(source) for source in sources}
+
+    def write_if_changed(self, file_name, data):
+        '''
+        only touch the output file if its contents are actually different
+        '''
+        path = self.output_path / file_name
+        digest = hash_bytes(data)
+        if path not in self.output_hashes and path.exists():
+            self.output_hashes[path] = hash_bytes(path.read_bytes())
+        if self.output_hashes.get(path) == digest:
+            return False
+
+        path.write_bytes(data)
+        self.output_hashes[path] = digest
+        return True
+
+    def build_table(self, input_file):
+        '''
+        same files as create_translation_binary
+        a string that fits in no block makes get_pointer_table raise, and rebuild reports it
+        '''
+        return get_binaries(prepare_for_writing(input_file), get_table_name(input_file))
+
+    def build_ascii(self):
+        '''
+        re-encode only the sheets that changed, the others stay encoded in memory
+        '''
+        for i, image_path in enumerate(image_paths):
+            sheet_hash = hash_bytes(Path(image_path).read_bytes())
+            if sheet_hash != self.sheet_hashes[i]:
+                self.sheet_tiles[i] = encode_cells(get_sheet_cells(image_path))
+                self.sheet_hashes[i] = sheet_hash
+
+        return [(ascii_file_name, np.stack(self.sheet_tiles, axis=1).tobytes())]
+
+    def build(self, target):
+        '''
+        rebuild one target and write whatever changed
+        returns the files that got written
+        '''
+        kind, path = target
+        if kind == "table":
+            files = self.build_table(path)
+        else:
+            files = self.build_ascii()
+
+        old_files = set(self.outputs.get(target, []))
+        self.outputs[target] = [file_name for file_name, data in files]
+        for file_name in old_files - set(self.outputs[target]):
+            print("   ", file_name, "isn't built anymore (the blocks moved)")
+
+        return [file_name for file_name, data in files if self.write_if_changed(file_name, data)]
+
+    def rebuild(self, targets):
+        for target in sorted(targets, key=str):
+            start = time.perf_counter()
+            if target[0] == "table" and not target[1].exists():
+                print(target[1].name, "was deleted")
+                self.outputs.pop(target, None)
+                continue
+
+            try:
+                written = self.build(target)
+            except Exception as error:
+                # a half-saved csv shouldn't take the whole thing down
+                print("   ", "couldn't build", target[1] or ascii_file_name + ":", repr(error))
+                continue
+
+            milliseconds = 1000 * (time.perf_counter() - start)
+            name = target[1].name if target[1] else ascii_file_name
+            if written:
+                print(name, "->", ", ".join(written), format(milliseconds, ".0f"), "ms")
+            else:
+                print(name, "unchanged,", format(milliseconds, ".0f"), "ms")
+
+
+def watch(output_path):
+    '''
+    build everything once, then rebuild whatever a saved file feeds into, forever
+    '''
+    builder = Builder(output_path)
+    builder.rebuild(set(builder.get_graph().values()))
+
+    watcher = get_watcher([translations_path, image_paths[0].parent])
+    print("Watching", translations_path, "and", image_paths[0].parent)
+    try:
+        while True:
+            changed = watcher.wait()
+            targets = {get_target(path) for path in changed} - {None}
+            builder.rebuild(targets)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+
+
+if __name__ == "__main__":
+
+    output_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(".")
+    output_path.mkdir(parents=True, exist_ok=True)
+    watch(output_path)